@@ -1,21 +1,137 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
-from .models import Patient, Doctor, Category
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
+from .cache import get_category_catalogue, record
+from .models import Patient, Doctor, Category, EmailOutbox
+
+# Performance mode (ADMIN_PERFORMANCE_MODE): past this many rows, as the
+# planner estimates them, changelists show the estimate instead of counting
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+FILTER_CACHE_TIMEOUT = getattr(settings, 'ADMIN_FILTER_CACHE_TIMEOUT', 300)
+
+
+def estimated_count(queryset):
+    """
+    The planner's row estimate for `queryset` on Postgres, from table
+    statistics and without running it. None elsewhere.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts exactly only when the planner expects a small result."""
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """
+    Filter on the distinct values of `field`, which are looked up with a
+    DISTINCT scan at most once every ADMIN_FILTER_CACHE_TIMEOUT seconds
+    rather than on every changelist page.
+    """
+    field = None
+
+    def lookups(self, request, model_admin):
+        key = f'admin_filter:{model_admin.model._meta.label_lower}:{self.field}'
+        choices = cache.get(key)
+        record('admin_filter', choices is not None)
+        if choices is None:
+            choices = list(
+                model_admin.model.objects.order_by(self.field).values_list(self.field, flat=True).distinct()
+            )
+            cache.set(key, choices, FILTER_CACHE_TIMEOUT)
+        return [(choice, choice) for choice in choices if choice]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field: self.value()})
+        return queryset
+
+
+def cached_choices_filter(field, title):
+    return type(f'{field.title()}Filter', (CachedChoicesFilter,), {
+        'field': field, 'title': title, 'parameter_name': field,
+    })
+
+
+class CategoryFilter(admin.SimpleListFilter):
+    """Programs from the cached category catalogue, so listing them costs no query."""
+    title = 'programs'
+    parameter_name = 'categories__id__exact'
+
+    def lookups(self, request, model_admin):
+        return [(str(category['id']), category['name']) for category in get_category_catalogue()]
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(categories__id=int(self.value()))
+        return queryset
+
+
+class PerformanceModeAdmin(admin.ModelAdmin):
+    """
+    With ADMIN_PERFORMANCE_MODE on, large changelists use estimated counts
+    and skip the second, unfiltered COUNT(*) behind "N total".
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if getattr(settings, 'ADMIN_PERFORMANCE_MODE', True):
+            self.paginator = EstimatedCountPaginator
+            self.show_full_result_count = False
+
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(PerformanceModeAdmin):
     list_display = ('PatID', 'FName', 'SName', 'Age', 'get_categories', 'city', 'created_at')
-    search_fields = ('PatID', 'FName', 'SName', 'categories__name')
-    list_filter = ('categories', 'city')
+    # Searched with Patient.objects.search(): prefix matches the PatID and
+    # trigram indexes can serve, see get_search_results
+    search_fields = ('PatID', 'FName', 'MName', 'SName', 'city')
+    search_help_text = 'Prefix of a name, city or patient ID'
+    list_filter = (CategoryFilter, cached_choices_filter('city', 'city'))
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('categories', queryset=Category.objects.only('id', 'name'))
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.split():
+            return queryset, False
+        return queryset.search(search_term), False
 
     def get_categories(self, obj):
         return ", ".join([category.name for category in obj.categories.all()])
     get_categories.short_description = 'Programs'
 
 @admin.register(Doctor)
-class DoctorAdmin(admin.ModelAdmin):
+class DoctorAdmin(PerformanceModeAdmin):
     list_display = ('employee_id', 'get_full_name', 'specialization', 'is_active', 'created_at')
-    search_fields = ('employee_id', 'user__first_name', 'user__last_name', 'specialization')
-    list_filter = ('is_active', 'specialization')
+    list_select_related = ('user',)
+    # Prefix matches (istartswith) rather than icontains
+    search_fields = ('^employee_id', '^user__first_name', '^user__last_name', '^specialization')
+    list_filter = ('is_active', cached_choices_filter('specialization', 'specialization'))
 
     def get_full_name(self, obj):
         return f"{obj.user.first_name} {obj.user.last_name}"
@@ -25,3 +141,9 @@ class DoctorAdmin(admin.ModelAdmin):
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_at', 'updated_at')
     search_fields = ('name', 'description')
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(PerformanceModeAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'last_error')
@@ -0,0 +1,99 @@
+import hashlib
+from collections import Counter
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Value, When
+from .cache import analytics_version, category_version, get_category_catalogue, record
+from .models import Patient
+
+ANALYTICS_CACHE_TIMEOUT = getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 300)
+FILTER_PARAMS = ('q', 'city', 'category', 'created_after', 'created_before')
+
+# (label, lowest age in the bracket); the last bracket is open ended
+AGE_BRACKETS = (
+    ('0-17', 0),
+    ('18-29', 18),
+    ('30-44', 30),
+    ('45-59', 45),
+    ('60-74', 60),
+    ('75+', 75),
+)
+
+
+def _years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        # 29 February in a non-leap year
+        return day.replace(year=day.year - years, day=28)
+
+
+def age_bracket(today):
+    """
+    Age bracket worked out from DOB rather than the stored Age, which goes
+    stale. Someone is at least N years old when born on or before
+    today minus N years, so this is a plain range comparison on DOB.
+    """
+    whens = []
+    for (label, _), (_, next_lowest) in zip(AGE_BRACKETS, AGE_BRACKETS[1:]):
+        whens.append(When(DOB__gt=_years_before(today, next_lowest), then=Value(label)))
+    return Case(*whens, default=Value(AGE_BRACKETS[-1][0]), output_field=CharField())
+
+
+def compute_patient_analytics(patients, today=None):
+    today = today or date.today()
+
+    # One pass over the patients gives both the city and age breakdowns
+    by_city = Counter()
+    by_age = Counter()
+    rows = (
+        patients.annotate(age_bracket=age_bracket(today))
+        .values('city', 'age_bracket')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        by_city[row['city']] += row['count']
+        by_age[row['age_bracket']] += row['count']
+
+    # Program counts come from the through table; it only has to be joined
+    # back to the patients when they're filtered.
+    memberships = Patient.categories.through.objects.all()
+    if patients.query.has_filters():
+        memberships = memberships.filter(patient__in=patients.values('id'))
+    by_program = dict(
+        memberships.values_list('category_id').annotate(count=Count('patient_id')).order_by()
+    )
+
+    return {
+        'total': sum(by_city.values()),
+        'by_program': [
+            {'id': category['id'], 'name': category['name'], 'count': by_program.get(category['id'], 0)}
+            for category in get_category_catalogue()
+        ],
+        'by_city': [{'city': city, 'count': count} for city, count in by_city.most_common()],
+        'by_age': [{'bracket': label, 'count': by_age[label]} for label, _ in AGE_BRACKETS],
+    }
+
+
+def get_patient_analytics(patients, params):
+    """
+    Cached compute_patient_analytics(), keyed on the filter parameters that
+    produced `patients`, today's date, the category catalogue version and the
+    analytics version, which patient writes bump (see Backend.signals). The
+    versions live in the default cache: with the per-process locmem backend,
+    writes made through another worker show up here only once
+    ANALYTICS_CACHE_TIMEOUT runs out.
+    """
+    filters = repr(sorted((name, params.get(name)) for name in FILTER_PARAMS if params.get(name)))
+    digest = hashlib.md5(filters.encode(), usedforsecurity=False).hexdigest()
+    key = f'patient_analytics:{date.today().isoformat()}:{analytics_version()}:{category_version()}:{digest}'
+
+    analytics = cache.get(key)
+    record('patient_analytics', analytics is not None)
+    if analytics is None:
+        analytics = compute_patient_analytics(patients)
+        cache.set(key, analytics, ANALYTICS_CACHE_TIMEOUT)
+    return analytics
@@ -0,0 +1,137 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .models import Category, Doctor
+
+CATEGORY_VERSION_KEY = 'categories:version'
+ANALYTICS_VERSION_KEY = 'patient_analytics:version'
+CATEGORY_CACHE_TIMEOUT = getattr(settings, 'CATEGORY_CACHE_TIMEOUT', 300)
+DOCTOR_STATS_KEY = 'doctor_stats'
+DOCTOR_STATS_TIMEOUT = getattr(settings, 'DOCTOR_STATS_CACHE_TIMEOUT', 60)
+AUTH_USER_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+AUTH_USER_RECHECK_INTERVAL = getattr(settings, 'AUTH_USER_RECHECK_INTERVAL', 5)
+
+# Hit/miss counters for this process, keyed by cache name
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+
+def record(name, hit):
+    _stats[name]['hits' if hit else 'misses'] += 1
+
+
+def cache_stats():
+    return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def category_version():
+    # Versions are timestamps rather than counters, so a version key that got
+    # evicted can never come back pointing at an old catalogue.
+    return cache.get_or_set(CATEGORY_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def analytics_version():
+    return cache.get_or_set(ANALYTICS_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def invalidate_analytics():
+    cache.set(ANALYTICS_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_category_catalogue():
+    """
+    Serialized list of every category, served from the cache until a
+    category is written.
+    """
+    key = f'categories:v{category_version()}'
+    catalogue = cache.get(key)
+    record('categories', catalogue is not None)
+    if catalogue is None:
+        from .serializers import CategorySerializer
+        catalogue = list(CategorySerializer(Category.objects.order_by('id'), many=True).data)
+        cache.set(key, catalogue, CATEGORY_CACHE_TIMEOUT)
+    return catalogue
+
+
+def get_category_ids():
+    return {category['id'] for category in get_category_catalogue()}
+
+
+def unknown_category_ids(category_ids):
+    """
+    The ids in `category_ids` that don't belong to a category. Ids missing
+    from the cached catalogue are looked up before being declared unknown:
+    with a per-process cache, a category created through another worker
+    only reaches this one's catalogue once it expires.
+    """
+    missing = set(category_ids) - get_category_ids()
+    if not missing:
+        return set()
+    found = set(Category.objects.filter(pk__in=missing).values_list('pk', flat=True))
+    if found:
+        # This process's catalogue is out of date
+        invalidate_category_cache()
+    return missing - found
+
+
+def existing_category_ids(category_ids):
+    """Drop ids that don't belong to a category, without a query when the catalogue knows them all."""
+    category_ids = [int(pk) for pk in category_ids if str(pk).isdigit()]
+    unknown = unknown_category_ids(category_ids)
+    return [pk for pk in category_ids if pk not in unknown]
+
+
+def invalidate_category_cache():
+    cache.set(CATEGORY_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_doctor_stats():
+    """
+    Doctor totals for the dashboard, computed from a single GROUP BY
+    specialization query and cached until a doctor changes (or the short
+    timeout runs out, for writes that bypass model signals).
+    """
+    stats = cache.get(DOCTOR_STATS_KEY)
+    record('doctor_stats', stats is not None)
+    if stats is not None:
+        return stats
+
+    rows = (
+        Doctor.objects.values('specialization')
+        .annotate(total=Count('id'), active=Count('id', filter=Q(is_active=True)))
+        .order_by('specialization')
+    )
+    by_specialization = [
+        {
+            'specialization': row['specialization'],
+            'total': row['total'],
+            'active': row['active'],
+            'pending_verification': row['total'] - row['active'],
+        }
+        for row in rows
+    ]
+    total = sum(row['total'] for row in by_specialization)
+    active = sum(row['active'] for row in by_specialization)
+    stats = {
+        'total_doctors': total,
+        'active_doctors': active,
+        'pending_verification': total - active,
+        'specializations': len(by_specialization),
+        'by_specialization': by_specialization,
+    }
+    cache.set(DOCTOR_STATS_KEY, stats, DOCTOR_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_doctor_stats():
+    cache.delete(DOCTOR_STATS_KEY)
+
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def invalidate_user_cache(user_id):
+    cache.delete(user_cache_key(user_id))
@@ -0,0 +1,78 @@
+from django.db import connections, router, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from .cache import invalidate_analytics
+from .models import Category, Patient
+
+# Patients per statement, well under the bound-parameter limits of SQLite
+# and Postgres
+CHUNK_SIZE = 10000
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _insert_memberships(patient_ids, category_ids):
+    """
+    INSERT ... SELECT a through row for every (patient, category) pair in one
+    statement, skipping pairs that already exist. Returns the rows inserted.
+    """
+    Through = Patient.categories.through
+    connection = connections[router.db_for_write(Through)]
+    qn = connection.ops.quote_name
+    sql = (
+        f"{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} {qn(Through._meta.db_table)} "
+        f"({qn('patient_id')}, {qn('category_id')}) "
+        f"SELECT patients.{qn('id')}, categories.{qn('id')} "
+        f"FROM {qn(Patient._meta.db_table)} patients, {qn(Category._meta.db_table)} categories "
+        f"WHERE patients.{qn('id')} IN ({', '.join(['%s'] * len(patient_ids))}) "
+        f"AND categories.{qn('id')} IN ({', '.join(['%s'] * len(category_ids))}) "
+        f"{connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (*patient_ids, *category_ids))
+        return cursor.rowcount
+
+
+def _assign(patient_ids, add, remove):
+    Through = Patient.categories.through
+    add, remove = list(add), list(remove)
+    added = removed = 0
+    now = timezone.now()
+    for chunk in _chunks(patient_ids):
+        if add:
+            added += _insert_memberships(chunk, add)
+        if remove:
+            removed += Through.objects.filter(patient_id__in=chunk, category_id__in=remove).delete()[0]
+        # Through-table writes send no m2m_changed, so bump the Last-Modified
+        # stamp the signal handler would have
+        Patient.objects.filter(pk__in=chunk).update(created_at=now)
+    invalidate_analytics()
+    return {'matched': len(patient_ids), 'added': added, 'removed': removed}
+
+
+def assign_categories(patients, add=(), remove=()):
+    """
+    Enroll every patient in `patients` (a queryset) in the `add` categories
+    and take them out of the `remove` ones in one transaction, with a few
+    set-based statements per CHUNK_SIZE patients instead of a
+    categories.set() per patient. The patients are picked before anything
+    changes, so a filter on programs or created_at can't shift under it.
+    """
+    with transaction.atomic():
+        patient_ids = list(patients.order_by().values_list('pk', flat=True).distinct())
+        return _assign(patient_ids, add, remove)
+
+
+def assign_categories_by_patid(patids, add=(), remove=()):
+    """assign_categories() for a list of PatIDs; also counts those not found."""
+    patids = sorted(set(patids))
+    with transaction.atomic():
+        patient_ids = []
+        for chunk in _chunks(patids):
+            patient_ids += Patient.objects.filter(PatID__in=chunk).values_list('pk', flat=True)
+        summary = _assign(patient_ids, add, remove)
+    summary['not_found'] = len(patids) - summary['matched']
+    return summary
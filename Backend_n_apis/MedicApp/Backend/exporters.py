@@ -0,0 +1,75 @@
+import csv
+import json
+from collections import defaultdict
+from datetime import date
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from .importers import calculate_age
+from .models import Patient
+
+EXPORT_FIELDS = ('id', 'PatID', 'FName', 'MName', 'SName', 'DOB', 'city', 'created_at')
+EXPORT_COLUMNS = ('PatID', 'FName', 'MName', 'SName', 'DOB', 'Age', 'city', 'created_at', 'programs')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Write-only file object for csv.writer that hands each line back."""
+
+    def write(self, value):
+        return value
+
+
+def iter_patient_records(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield one dict per patient, reading the queryset through a server-side
+    cursor and loading the program names with one query per chunk.
+    """
+    Through = Patient.categories.through
+    today = date.today()
+    rows = queryset.order_by('PatID').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        programs = defaultdict(list)
+        memberships = Through.objects.filter(
+            patient_id__in=[row[0] for row in chunk]
+        ).values_list('patient_id', 'category__name')
+        for patient_id, name in memberships:
+            programs[patient_id].append(name)
+
+        for pk, patient_id, first, middle, surname, dob, city, created_at in chunk:
+            yield {
+                'PatID': patient_id,
+                'FName': first,
+                'MName': middle,
+                'SName': surname,
+                'DOB': dob,
+                'Age': calculate_age(dob, today),
+                'city': city,
+                'created_at': created_at,
+                'programs': sorted(programs[pk]),
+            }
+
+
+def csv_lines(records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for record in records:
+        record['DOB'] = record['DOB'].isoformat()
+        record['created_at'] = record['created_at'].isoformat()
+        record['programs'] = ';'.join(record['programs'])
+        yield writer.writerow([record[column] for column in EXPORT_COLUMNS])
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv', 'patients.csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson', 'patients.ndjson'),
+}
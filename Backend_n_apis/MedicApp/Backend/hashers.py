@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher, make_password
+
+HASH_WORKERS = getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+POOL_IDLE_TIMEOUT = getattr(settings, 'PASSWORD_HASH_POOL_IDLE_TIMEOUT', 60)
+
+# Pools by size, started on first use and shut down once idle for
+# POOL_IDLE_TIMEOUT seconds. Workers are spawned rather than forked so they
+# never inherit a lock held by another thread, and only need the settings,
+# not the app registry.
+_pools = {}
+_pool_users = {}
+_idle_timers = {}
+_pools_lock = threading.Lock()
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 with PASSWORD_PBKDF2_ITERATIONS iterations. It keeps Django's
+    algorithm name, so existing hashes are recognised and re-hashed with the
+    new count the next time their owner logs in.
+    """
+    iterations = getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """Scrypt with PASSWORD_SCRYPT_WORK_FACTOR as its N parameter."""
+    work_factor = getattr(settings, 'PASSWORD_SCRYPT_WORK_FACTOR', ScryptPasswordHasher.work_factor)
+
+
+def _make_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def _acquire_pool(workers):
+    with _pools_lock:
+        timer = _idle_timers.pop(workers, None)
+        if timer is not None:
+            timer.cancel()
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_users[workers] = 0
+        _pool_users[workers] += 1
+        return _pools[workers]
+
+
+def _release_pool(workers, pool):
+    with _pools_lock:
+        if _pools.get(workers) is not pool:
+            return
+        _pool_users[workers] -= 1
+        if not _pool_users[workers]:
+            timer = threading.Timer(POOL_IDLE_TIMEOUT, _shutdown_idle_pool, (workers, pool))
+            timer.daemon = True
+            timer.start()
+            _idle_timers[workers] = timer
+
+
+def _shutdown_idle_pool(workers, pool):
+    with _pools_lock:
+        if _pools.get(workers) is not pool or _pool_users[workers]:
+            return
+        del _pools[workers], _pool_users[workers]
+        _idle_timers.pop(workers, None)
+    pool.shutdown(wait=False)
+
+
+def _discard_pool(workers, pool):
+    """Forget a pool whose worker died, so the next call starts a new one."""
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers], _pool_users[workers]
+    pool.shutdown(wait=False)
+
+
+def make_passwords(passwords, workers=None):
+    """
+    make_password() for many passwords at once, spread over a pool of
+    HASH_WORKERS processes (PASSWORD_HASH_WORKERS). Hashes come back in the
+    order of `passwords`; `workers=1` hashes them in this process. A pool
+    whose worker died (OOM kill, crash) is replaced and the batch retried
+    once.
+    """
+    passwords = list(passwords)
+    workers = workers or HASH_WORKERS
+    if workers <= 1 or len(passwords) < 2:
+        return _make_passwords(passwords)
+    # A few chunks per worker keeps them all busy without a round trip per hash
+    size = max(1, -(-len(passwords) // (workers * 4)))
+    chunks = [passwords[start:start + size] for start in range(0, len(passwords), size)]
+    for attempt in range(2):
+        pool = _acquire_pool(workers)
+        try:
+            return list(chain.from_iterable(pool.map(_make_passwords, chunks)))
+        except BrokenProcessPool:
+            _discard_pool(workers, pool)
+            if attempt:
+                raise
+        finally:
+            _release_pool(workers, pool)
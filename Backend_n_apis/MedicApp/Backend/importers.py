@@ -0,0 +1,217 @@
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from itertools import islice
+
+from django.db import transaction
+from .cache import get_category_ids, invalidate_analytics, unknown_category_ids
+from .models import Patient
+
+REQUIRED_FIELDS = ('FName', 'MName', 'SName', 'PatID', 'DOB', 'city')
+TEXT_FIELDS = ('FName', 'MName', 'SName', 'city')
+DEFAULT_CHUNK_SIZE = 1000
+# Only this many row errors are kept in the summary, the rest are just counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class RowError(Exception):
+    pass
+
+
+def iter_csv_rows(stream):
+    """
+    Yield dicts from a CSV text stream. `category_ids` may hold several ids
+    separated by `;`.
+    """
+    for row in csv.DictReader(stream):
+        ids = (row.get('category_ids') or '').replace(',', ';')
+        row['category_ids'] = [part.strip() for part in ids.split(';') if part.strip()]
+        yield row
+
+
+def iter_ndjson_rows(stream):
+    """
+    Yield dicts from a newline delimited JSON text stream. Lines that aren't
+    valid JSON objects are yielded as RowError so they get reported in place.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            yield RowError('Invalid JSON')
+            continue
+        yield row if isinstance(row, dict) else RowError('Expected a JSON object')
+
+
+def format_from_name(name):
+    return os.path.splitext(name)[1].lstrip('.').lower()
+
+
+def open_rows(binary_stream, file_format):
+    text = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        return iter_csv_rows(text)
+    if file_format in ('ndjson', 'jsonl'):
+        return iter_ndjson_rows(text)
+    raise ValueError(f"Unsupported format '{file_format}'. Use csv or ndjson")
+
+
+def calculate_age(dob, today):
+    return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+
+
+def _clean_row(row, today, category_ids):
+    if isinstance(row, RowError):
+        raise row
+
+    missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        raise RowError(f"Missing fields: {', '.join(missing)}")
+
+    for field in TEXT_FIELDS:
+        if len(str(row[field])) > 100:
+            raise RowError(f"{field} must be at most 100 characters")
+
+    try:
+        patient_id = int(row['PatID'])
+    except (TypeError, ValueError):
+        raise RowError("Patient ID must be a number")
+
+    try:
+        dob = datetime.strptime(str(row['DOB']), '%Y-%m-%d').date()
+    except ValueError:
+        raise RowError("Invalid date format. Use YYYY-MM-DD")
+
+    try:
+        categories = {int(pk) for pk in row.get('category_ids') or []}
+    except (TypeError, ValueError):
+        raise RowError("category_ids must be numbers")
+    unknown = categories - category_ids
+    if unknown:
+        unknown = unknown_category_ids(unknown)
+        if not unknown:
+            # Created after the import started, or through another worker
+            category_ids |= categories
+    if unknown:
+        raise RowError(f"Unknown category ids: {', '.join(map(str, sorted(unknown)))}")
+
+    patient = Patient(
+        FName=row['FName'],
+        MName=row['MName'],
+        SName=row['SName'],
+        PatID=patient_id,
+        Age=calculate_age(dob, today),
+        DOB=dob,
+        city=row['city'],
+    )
+    return patient, categories
+
+
+class PatientImporter:
+    """
+    Imports patients chunk by chunk: each chunk is validated in memory, checked
+    for existing PatIDs with one query and written with bulk_create plus one
+    bulk insert into the categories through table. Bad rows are reported and
+    skipped, they never abort the rest of the import; if the chunk's insert
+    fails anyway, its rows are retried one at a time.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.category_ids = get_category_ids()
+
+    def run(self, rows):
+        rows = iter(rows)
+        start = 1
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk, start)
+            start += len(chunk)
+        if self.created:
+            # bulk_create sends no post_save
+            invalidate_analytics()
+        return self.summary()
+
+    def summary(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+    def _error(self, row_number, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'detail': detail})
+
+    def _import_chunk(self, chunk, start):
+        today = date.today()
+        valid = {}
+        for row_number, row in enumerate(chunk, start):
+            try:
+                patient, categories = _clean_row(row, today, self.category_ids)
+            except RowError as e:
+                self._error(row_number, str(e))
+                continue
+            if patient.PatID in valid:
+                self._error(row_number, "Duplicate patient ID in file")
+                continue
+            valid[patient.PatID] = (row_number, patient, categories)
+
+        existing = set(
+            Patient.objects.filter(PatID__in=list(valid)).values_list('PatID', flat=True)
+        )
+        for patient_id in existing:
+            row_number, _, _ = valid.pop(patient_id)
+            self._error(row_number, "A patient with this ID already exists")
+
+        if not valid:
+            return
+
+        try:
+            with transaction.atomic():
+                self._write(list(valid.values()))
+        except Exception:
+            # One bad row fails the whole chunk (e.g. a PatID another import
+            # took since the check above); write the rows one by one, each
+            # in its own savepoint, so only the bad ones are reported
+            for row_number, patient, categories in valid.values():
+                patient.pk = None
+                patient._state.adding = True
+                try:
+                    with transaction.atomic():
+                        self._write([(row_number, patient, categories)])
+                except Exception as e:
+                    self._error(row_number, str(e))
+                else:
+                    self.created += 1
+            return
+
+        self.created += len(valid)
+
+    def _write(self, entries):
+        """Insert the (row number, patient, category ids) entries and their memberships."""
+        Through = Patient.categories.through
+        patients = Patient.objects.bulk_create([patient for _, patient, _ in entries])
+        # Some backends don't return primary keys from bulk_create
+        if any(patient.pk is None for patient in patients):
+            pks = dict(
+                Patient.objects.filter(PatID__in=[patient.PatID for patient in patients]).values_list('PatID', 'id')
+            )
+            for patient in patients:
+                patient.pk = pks[patient.PatID]
+        Through.objects.bulk_create([
+            Through(patient_id=patient.pk, category_id=category_id)
+            for _, patient, categories in entries
+            for category_id in categories
+        ])
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Backend.synthetic import DEFAULT_BATCH_SIZE, DOCTOR_PASSWORD, PROGRAMS, generate
+
+
+class Command(BaseCommand):
+    help = 'Add synthetic programs, patients and doctors with bulk inserts, for benchmarks and load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--categories', type=int, default=len(PROGRAMS))
+        parser.add_argument('--max-programs', type=int, default=3,
+                            help='Most programs a single patient is enrolled in')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        summary = generate(
+            patients=options['patients'],
+            doctors=options['doctors'],
+            categories=options['categories'],
+            max_programs=options['max_programs'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(
+            f"Created {summary['patients']} patients with {summary['memberships']} program memberships, "
+            f"{summary['doctors']} doctors and {summary['categories']} programs "
+            f"in {time.perf_counter() - start:.1f}s (doctor password: {DOCTOR_PASSWORD})"
+        )
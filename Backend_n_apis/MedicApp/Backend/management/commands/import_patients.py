@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from Backend.importers import DEFAULT_CHUNK_SIZE, PatientImporter, format_from_name, open_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream patients from a CSV or NDJSON file into the database in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help='File format, guessed from the extension when omitted')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or format_from_name(path)
+
+        try:
+            with open(path, 'rb') as f:
+                summary = PatientImporter(options['chunk_size']).run(open_rows(f, file_format))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in summary['errors']:
+            self.stderr.write(f"row {error['row']}: {error['detail']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['created']} patients, {summary['failed']} rows failed"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from Backend.importers import format_from_name
+from Backend.onboarding import DEFAULT_CHUNK_SIZE, DoctorOnboarder, open_roster
+
+
+class Command(BaseCommand):
+    help = ('Create verified doctor accounts from a CSV, NDJSON or JSON roster and queue their '
+            'credential emails, hashing the generated passwords in a process pool')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson', 'json'],
+                            help='File format, guessed from the extension when omitted')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, help='Hashing processes, PASSWORD_HASH_WORKERS by default')
+        parser.add_argument('--pending', action='store_true',
+                            help='Create the accounts unverified, without passwords or emails')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or format_from_name(path)
+        onboarder = DoctorOnboarder(options['chunk_size'], verified=not options['pending'], workers=options['workers'])
+
+        try:
+            with open(path, 'rb') as f:
+                summary = onboarder.run(open_roster(f, file_format))
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in summary['errors']:
+            self.stderr.write(f"row {error['row']}: {error['detail']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Onboarded {summary['created']} doctors, {summary['failed']} rows failed"
+        ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Backend.outbox import BATCH_SIZE, send_pending
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox, reusing one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll the outbox every --interval seconds')
+        parser.add_argument('--interval', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_pending(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} emails, {failed} failed")
+            # A full batch means there may be more waiting, so go again right away
+            if sent + failed >= options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Trigram GIN indexes on the same UPPER(col::text) expression Django emits for
+# __istartswith/__icontains on Postgres, so name and city searches don't scan
+# the whole table. Other databases (SQLite in tests) run the same queries
+# without them.
+TRIGRAM_COLUMNS = ('FName', 'MName', 'SName', 'city')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in TRIGRAM_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "patient_{column.lower()}_trgm" '
+            f'ON "Backend_patient" USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in TRIGRAM_COLUMNS:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "patient_{column.lower()}_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('Backend', '0006_alter_patient_dob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
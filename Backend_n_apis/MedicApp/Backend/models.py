@@ -1,5 +1,63 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils import timezone
+
+# Largest value an IntegerField (and so PatID) can hold
+MAX_PATID = 2147483647
+
+def patid_prefix_q(prefix):
+    """
+    Match PatIDs whose decimal form starts with `prefix`, e.g. 12 -> 12,
+    120-129, 1200-1299, ... as integer ranges the unique index can serve.
+    """
+    if prefix.startswith('0'):
+        return Q(PatID=0) if prefix == '0' else Q(pk__in=[])
+
+    query = Q()
+    low = high = int(prefix)
+    while low <= MAX_PATID:
+        query |= Q(PatID__gte=low, PatID__lte=high)
+        low, high = low * 10, high * 10 + 9
+    return query or Q(pk__in=[])
+
+class PatientQuerySet(models.QuerySet):
+    SEARCH_FIELDS = ('SName', 'FName', 'MName', 'city')
+
+    def search(self, query):
+        """
+        Prefix search over names, city and PatID. Every whitespace separated
+        term has to match one of the fields; results are annotated with a
+        `rank` (exact PatID, PatID prefix, surname, first name, middle name,
+        city) worked out from the first term.
+        """
+        terms = query.split()
+        if not terms:
+            return self.none()
+
+        matches = Q()
+        for term in terms:
+            term_q = Q()
+            for field in self.SEARCH_FIELDS:
+                term_q |= Q(**{f'{field}__istartswith': term})
+            if term.isdigit():
+                term_q |= patid_prefix_q(term)
+            matches &= term_q
+
+        first = terms[0]
+        whens = []
+        if first.isdigit():
+            whens += [
+                When(PatID=int(first), then=Value(0)),
+                When(patid_prefix_q(first), then=Value(1)),
+            ]
+        whens += [
+            When(SName__istartswith=first, then=Value(2)),
+            When(FName__istartswith=first, then=Value(3)),
+            When(MName__istartswith=first, then=Value(4)),
+        ]
+        rank = Case(*whens, default=Value(5), output_field=IntegerField())
+        return self.filter(matches).annotate(rank=rank).order_by('rank', 'PatID')
 
 class Patient(models.Model):
     FName = models.CharField(max_length=100)
@@ -12,6 +70,17 @@ class Patient(models.Model):
     categories = models.ManyToManyField('Category', related_name='patients')
     created_at = models.DateTimeField(auto_now=True)
 
+    objects = PatientQuerySet.as_manager()
+
+    class Meta:
+        # Name/city search uses the trigram indexes from migration 0007
+        indexes = [
+            # city filter (API and admin) walked in cursor order
+            models.Index(fields=['city', 'PatID'], name='patient_city_patid_idx'),
+            # created_after/created_before and Max(created_at) for Last-Modified
+            models.Index(fields=['created_at'], name='patient_created_at_idx'),
+        ]
+
     def __str__(self):
         return (
             f"name: {self.FName} {self.MName} {self.SName}, age: {self.Age}, "
@@ -26,6 +95,16 @@ class Doctor(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # doctor stats GROUP BY and the admin specialization filter
+            models.Index(fields=['specialization', 'is_active'], name='doctor_spec_active_idx'),
+            # the few doctors still waiting for verification, oldest first
+            models.Index(fields=['created_at'], name='doctor_pending_idx', condition=Q(is_active=False)),
+            # Max(updated_at) for Last-Modified
+            models.Index(fields=['updated_at'], name='doctor_updated_at_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.employee_id})"
 
@@ -39,3 +118,45 @@ class Category(models.Model):
         return self.name
 
 
+
+class EmailOutbox(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+class TokenRevocation(models.Model):
+    """
+    Every token issued to `user` before `revoked_before` is rejected, which
+    is how "log out everywhere" reaches access tokens and rotated refresh
+    tokens that were never recorded as outstanding.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='token_revocation')
+    revoked_before = models.DateTimeField()
+
+    def __str__(self):
+        return f"Tokens for {self.user} issued before {self.revoked_before}"
@@ -0,0 +1,255 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from .cache import invalidate_doctor_stats, user_cache_key
+from .hashers import make_passwords
+from .importers import MAX_REPORTED_ERRORS, RowError, open_rows
+from .models import Doctor
+from .outbox import enqueue_mails
+
+REQUIRED_FIELDS = ('employee_id', 'email', 'firstName', 'lastName')
+FIELD_LENGTHS = {'employee_id': 50, 'firstName': 150, 'lastName': 150, 'email': 254, 'specialization': 100}
+DEFAULT_CHUNK_SIZE = 500
+# Doctors that get a hashed password in one API request (DOCTOR_BATCH_MAX_ROWS).
+# Each hash takes about 0.4s of a core, so larger rosters would outlast the
+# worker timeout; they go through `manage.py onboard_doctors` instead.
+MAX_ROWS_PER_REQUEST = getattr(settings, 'DOCTOR_BATCH_MAX_ROWS', 50)
+
+
+def credentials_email(first_name, employee_id, password):
+    """(subject, body) of the message carrying a new doctor's login credentials."""
+    return (
+        'Your MedicApp Account Credentials',
+        f'Hello {first_name},\n\nYour MedicApp account has been created. Here are your login credentials:\n\n'
+        f'Employee ID: {employee_id}\nPassword: {password}\n\nPlease log in and change your password.',
+    )
+
+
+def verification_email(employee_id, password):
+    """(subject, body) of the message sent when a pending doctor is verified."""
+    return (
+        'MedicApp Account Verified',
+        f"""
+        Welcome to MedicApp!
+        
+        Your account has been verified. You can now login with the following credentials:
+        Employee ID: {employee_id}
+        Password: {password}
+        
+        Please login using these credentials and change your password after first login.
+        """,
+    )
+
+
+def open_roster(binary_stream, file_format):
+    """Rows of a CSV, NDJSON or JSON (a list of objects) roster file."""
+    if file_format != 'json':
+        return open_rows(binary_stream, file_format)
+    try:
+        rows = json.load(binary_stream)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Invalid JSON")
+    if not isinstance(rows, list):
+        raise ValueError("A JSON roster must be a list of doctors")
+    return [row if isinstance(row, dict) else RowError('Expected a JSON object') for row in rows]
+
+
+def _clean_row(row):
+    if isinstance(row, RowError):
+        raise row
+
+    missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        raise RowError(f"Missing fields: {', '.join(missing)}")
+
+    for field, length in FIELD_LENGTHS.items():
+        if len(str(row.get(field) or '')) > length:
+            raise RowError(f"{field} must be at most {length} characters")
+
+    try:
+        validate_email(row['email'])
+    except ValidationError:
+        raise RowError("Invalid email address")
+
+    return {field: str(row.get(field) or '').strip() for field in FIELD_LENGTHS}
+
+
+class DoctorOnboarder:
+    """
+    Onboards a roster of doctors chunk by chunk, like PatientImporter: each
+    chunk is validated in memory and checked for taken employee ids with one
+    query. Verified accounts get generated passwords, hashed in a process
+    pool outside the transaction; the User and Doctor rows and the
+    credential emails are then written with one bulk insert each. Bad rows
+    are reported and skipped.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, verified=True, workers=None):
+        self.chunk_size = chunk_size
+        self.verified = verified
+        self.workers = workers
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        start = 1
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._onboard_chunk(chunk, start)
+            start += len(chunk)
+        if self.created:
+            # bulk_create skips the post_save that would drop these
+            invalidate_doctor_stats()
+        return self.summary()
+
+    def summary(self):
+        return {
+            'created': self.created,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+    def _error(self, row_number, detail):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'detail': detail})
+
+    def _onboard_chunk(self, chunk, start):
+        valid = {}
+        for row_number, row in enumerate(chunk, start):
+            try:
+                doctor = _clean_row(row)
+            except RowError as e:
+                self._error(row_number, str(e))
+                continue
+            if doctor['employee_id'] in valid:
+                self._error(row_number, "Duplicate employee ID in file")
+                continue
+            valid[doctor['employee_id']] = (row_number, doctor)
+
+        existing = set(User.objects.filter(username__in=list(valid)).values_list('username', flat=True))
+        existing |= set(Doctor.objects.filter(employee_id__in=list(valid)).values_list('employee_id', flat=True))
+        for employee_id in existing:
+            row_number, _ = valid.pop(employee_id)
+            self._error(row_number, "A doctor with this employee ID already exists")
+
+        if not valid:
+            return
+
+        if self.verified:
+            passwords = [get_random_string(12) for _ in valid]
+            hashes = make_passwords(passwords, self.workers)
+        else:
+            # Unusable until verify_user sets one, and costs no hashing
+            passwords = [None] * len(valid)
+            hashes = [make_password(None) for _ in valid]
+
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        username=employee_id,
+                        email=doctor['email'],
+                        first_name=doctor['firstName'],
+                        last_name=doctor['lastName'],
+                        password=encoded,
+                        is_active=self.verified,
+                    )
+                    for (employee_id, (_, doctor)), encoded in zip(valid.items(), hashes)
+                ])
+                # Some backends don't return primary keys from bulk_create
+                if any(user.pk is None for user in users):
+                    pks = dict(User.objects.filter(username__in=list(valid)).values_list('username', 'id'))
+                    for user in users:
+                        user.pk = pks[user.username]
+                Doctor.objects.bulk_create([
+                    Doctor(
+                        user=user,
+                        employee_id=user.username,
+                        specialization=doctor['specialization'],
+                        is_active=self.verified,
+                    )
+                    for user, (_, doctor) in zip(users, valid.values())
+                ])
+                if self.verified:
+                    enqueue_mails([
+                        (*credentials_email(doctor['firstName'], employee_id, password), [doctor['email']])
+                        for (employee_id, (_, doctor)), password in zip(valid.items(), passwords)
+                    ])
+        except Exception as e:
+            for row_number, _ in valid.values():
+                self._error(row_number, str(e))
+            return
+
+        self.created += len(valid)
+
+
+def verify_doctors(employee_ids=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, limit=None):
+    """
+    Verify the given pending doctors, or every pending one when
+    `employee_ids` is None (the `limit` longest waiting, if given). Passwords are generated and hashed in the
+    process pool outside the transaction; each chunk is then activated with
+    one bulk_update of the users and one UPDATE of the doctors, and the
+    credential emails are queued together so the outbox delivers them over
+    one SMTP connection. Returns {employee_id: 'verified' | 'already_active'
+    | 'not_found'}.
+    """
+    if employee_ids is None:
+        # Served by doctor_pending_idx
+        candidates = Doctor.objects.filter(is_active=False).order_by('created_at')[:limit]
+        results = {}
+    else:
+        candidates = Doctor.objects.filter(employee_id__in=set(employee_ids))
+        results = dict.fromkeys(employee_ids, 'not_found')
+    rows = list(candidates.values_list('pk', 'employee_id', 'is_active'))
+
+    pending = []
+    for pk, employee_id, is_active in rows:
+        if is_active:
+            results[employee_id] = 'already_active'
+        else:
+            pending.append(pk)
+
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        passwords = [get_random_string(12) for _ in chunk]
+        hashes = dict(zip(chunk, make_passwords(passwords, workers)))
+        passwords = dict(zip(chunk, passwords))
+
+        with transaction.atomic():
+            # Re-read under lock, in case another admin got to some of them first
+            doctors = list(
+                Doctor.objects.select_for_update().filter(pk__in=chunk)
+                .values_list('pk', 'user_id', 'employee_id', 'is_active', 'user__email')
+            )
+            verified = [doctor for doctor in doctors if not doctor[3]]
+            User.objects.bulk_update(
+                [User(pk=user_id, password=hashes[pk], is_active=True) for pk, user_id, _, _, _ in verified],
+                ['password', 'is_active'],
+            )
+            Doctor.objects.filter(pk__in=[pk for pk, *_ in verified]).update(is_active=True, updated_at=timezone.now())
+            enqueue_mails([
+                (*verification_email(employee_id, passwords[pk]), [email])
+                for pk, _, employee_id, _, email in verified
+            ])
+
+        for pk, user_id, employee_id, is_active, _ in doctors:
+            results[employee_id] = 'already_active' if is_active else 'verified'
+        cache.delete_many([user_cache_key(user_id) for _, user_id, _, _, _ in verified])
+
+    if pending:
+        invalidate_doctor_stats()
+    return results
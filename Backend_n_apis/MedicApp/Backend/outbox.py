@@ -0,0 +1,140 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_DELAY = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60))
+# How long a sender may hold a claimed batch before it is considered dead
+LEASE = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE', 600))
+BATCH_SIZE = 100
+
+# One sender thread per process, so batches from the same worker never overlap
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='email-outbox')
+
+
+def enqueue_mail(subject, body, recipients, from_email=None):
+    """
+    Store a message in the outbox and return straight away. It is delivered
+    by `send_outbox` or, when EMAIL_OUTBOX_BACKGROUND_THREAD is on, by a
+    background thread once the current transaction commits.
+    """
+    message = EmailOutbox.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.EMAIL_HOST_USER or '',
+        recipients=list(recipients),
+    )
+    if getattr(settings, 'EMAIL_OUTBOX_BACKGROUND_THREAD', False):
+        transaction.on_commit(lambda: _executor.submit(_send_in_background))
+    return message
+
+
+def enqueue_mails(messages, from_email=None):
+    """
+    enqueue_mail() for many (subject, body, recipients) messages with a
+    single insert, and a single background send once the transaction commits.
+    """
+    created = EmailOutbox.objects.bulk_create([
+        EmailOutbox(
+            subject=subject,
+            body=body,
+            from_email=from_email or settings.EMAIL_HOST_USER or '',
+            recipients=list(recipients),
+        )
+        for subject, body, recipients in messages
+    ])
+    if created and getattr(settings, 'EMAIL_OUTBOX_BACKGROUND_THREAD', False):
+        transaction.on_commit(lambda: _executor.submit(_send_in_background))
+    return created
+
+
+def _send_in_background():
+    try:
+        send_pending()
+    except Exception:
+        logger.exception("Sending the email outbox failed")
+    finally:
+        close_old_connections()
+
+
+def _retry(message, error, now):
+    message.attempts += 1
+    message.last_error = str(error)
+    if message.attempts >= MAX_ATTEMPTS:
+        message.status = EmailOutbox.FAILED
+        # Bodies can hold credentials, and this one will never be sent
+        message.body = ''
+    else:
+        message.next_attempt_at = now + RETRY_DELAY * 2 ** (message.attempts - 1)
+
+
+def _claim(batch_size, now):
+    """
+    Lock a batch of due messages just long enough to lease them: pushing
+    next_attempt_at past LEASE keeps other senders off them while this one
+    delivers, and hands them back if it dies before recording the outcome.
+    """
+    with transaction.atomic():
+        batch = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        EmailOutbox.objects.filter(pk__in=[message.pk for message in batch]).update(next_attempt_at=now + LEASE)
+    return batch
+
+
+def send_pending(batch_size=BATCH_SIZE):
+    """
+    Deliver one batch of due messages over a single SMTP connection and
+    record the outcome of each. The batch is claimed and the outcomes saved
+    in two short transactions, so no rows stay locked while the mail server
+    is talked to. Failures are retried with exponential backoff until
+    MAX_ATTEMPTS. Returns (sent, failed) for the batch.
+    """
+    now = timezone.now()
+    sent = failed = 0
+    batch = _claim(batch_size, now)
+    if not batch:
+        return sent, failed
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for message in batch:
+            _retry(message, e, now)
+        failed = len(batch)
+    else:
+        try:
+            for message in batch:
+                email = EmailMessage(message.subject, message.body, message.from_email,
+                                     message.recipients, connection=connection)
+                try:
+                    connection.send_messages([email])
+                except Exception as e:
+                    _retry(message, e, now)
+                    failed += 1
+                    continue
+                message.status = EmailOutbox.SENT
+                message.attempts += 1
+                message.sent_at = timezone.now()
+                # Bodies can hold credentials, so they aren't kept once delivered
+                message.body = ''
+                sent += 1
+        finally:
+            connection.close()
+
+    with transaction.atomic():
+        EmailOutbox.objects.bulk_update(
+            batch, ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at', 'body']
+        )
+    return sent, failed
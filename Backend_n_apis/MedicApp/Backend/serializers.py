@@ -1,6 +1,9 @@
+from collections import defaultdict
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.utils import timezone
 from .models import Patient, Doctor, Category
+from .cache import existing_category_ids, get_category_catalogue, invalidate_category_cache
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,7 +31,7 @@ class PatientSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         category_ids = validated_data.pop('category_ids', [])
         patient = Patient.objects.create(**validated_data)
-        patient.categories.set(Category.objects.filter(id__in=category_ids))
+        patient.categories.set(existing_category_ids(category_ids))
         return patient
 
     def update(self, instance, validated_data):
@@ -38,7 +41,7 @@ class PatientSerializer(serializers.ModelSerializer):
         instance.save()
         
         if category_ids is not None:
-            instance.categories.set(Category.objects.filter(id__in=category_ids))
+            instance.categories.set(existing_category_ids(category_ids))
         
         return instance
 
@@ -49,4 +52,162 @@ class DoctorSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Doctor
-        fields = ('id', 'employee_id', 'firstName', 'lastName', 'email', 'specialization', 'is_active', 'created_at')
\ No newline at end of file
+        fields = ('id', 'employee_id', 'firstName', 'lastName', 'email', 'specialization', 'is_active', 'created_at')
+
+
+def parse_fields(value):
+    """Split a `?fields=a,b` parameter, returning None when it's absent."""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+def _date(value):
+    return value.isoformat()
+
+def _datetime(value):
+    # Same output as DRF's DateTimeField
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+class ValuesSerializer:
+    """
+    Read-only list serializer that builds plain dicts from .values() rows,
+    skipping the per-field work of a ModelSerializer while producing the same
+    output. `fields` maps each output name to its values() lookup and an
+    optional converter; a lookup of None marks a field filled in by
+    `computed()`. An optional subset of fields can be selected by name.
+    """
+    fields = {}
+    key_fields = ()
+
+    def __init__(self, fields=None):
+        if fields:
+            unknown = [field for field in fields if field not in self.fields]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        self.selected = [name for name in self.fields if not fields or name in fields]
+        # Output keys that differ from the field name
+        self.output_names = {}
+
+    def values(self, queryset):
+        lookups = set(self.key_fields)
+        lookups.update(self.fields[name][0] for name in self.selected if self.fields[name][0])
+        return queryset.values(*sorted(lookups))
+
+    def computed(self, rows):
+        return {}
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        computed = self.computed(rows)
+        columns = [(name, self.output_names.get(name, name), *self.fields[name]) for name in self.selected]
+        data = []
+        for row in rows:
+            item = {}
+            for name, output, lookup, convert in columns:
+                if lookup is None:
+                    item[output] = computed[name](row)
+                else:
+                    value = row[lookup]
+                    item[output] = convert(value) if convert and value is not None else value
+            data.append(item)
+        return data
+
+    def project(self, items):
+        """Select fields from dicts that are already serialized."""
+        return [{name: item[name] for name in self.selected} for item in items]
+
+class CategoryValuesSerializer(ValuesSerializer):
+    fields = {
+        'id': ('id', None),
+        'name': ('name', None),
+        'description': ('description', None),
+        'created_at': ('created_at', _datetime),
+        'updated_at': ('updated_at', _datetime),
+    }
+
+class PatientValuesSerializer(ValuesSerializer):
+    """
+    Lean counterpart of PatientSerializer for list endpoints. In normalized
+    mode each patient only carries `category_ids` and the categories they
+    reference are side-loaded once through `side_loaded_categories()`.
+    """
+    fields = {
+        'id': ('id', None),
+        'PatID': ('PatID', None),
+        'FName': ('FName', None),
+        'MName': ('MName', None),
+        'SName': ('SName', None),
+        'Age': ('Age', None),
+        'DOB': ('DOB', _date),
+        'city': ('city', None),
+        'categories': (None, None),
+        'created_at': ('created_at', _datetime),
+    }
+    # id joins the categories, PatID is the pagination cursor
+    key_fields = ('id', 'PatID')
+    chunk_size = 2000
+
+    def __init__(self, fields=None, normalized=False):
+        if fields:
+            fields = ['categories' if field == 'category_ids' else field for field in fields]
+        super().__init__(fields)
+        self.normalized = normalized
+        self.referenced = set()
+        if normalized:
+            self.output_names['categories'] = 'category_ids'
+
+    def computed(self, rows):
+        if 'categories' not in self.selected:
+            return {}
+
+        self.catalogue = {category['id']: category for category in get_category_catalogue()}
+        pairs = []
+        Through = Patient.categories.through
+        ids = [row['id'] for row in rows]
+        for start in range(0, len(ids), self.chunk_size):
+            pairs += Through.objects.filter(
+                patient_id__in=ids[start:start + self.chunk_size]
+            ).values_list('patient_id', 'category_id').order_by('category_id')
+
+        missing = {category_id for _, category_id in pairs if category_id not in self.catalogue}
+        if missing:
+            # Created through another worker since this process cached the
+            # catalogue (see unknown_category_ids)
+            self.catalogue.update(
+                (category['id'], category)
+                for category in CategorySerializer(Category.objects.filter(pk__in=missing), many=True).data
+            )
+            invalidate_category_cache()
+
+        memberships = defaultdict(list)
+        for patient_id, category_id in pairs:
+            if category_id in self.catalogue:
+                memberships[patient_id].append(category_id)
+
+        if self.normalized:
+            self.referenced.update(*memberships.values())
+            return {'categories': lambda row: memberships[row['id']]}
+        return {'categories': lambda row: [self.catalogue[pk] for pk in memberships[row['id']]]}
+
+    def side_loaded_categories(self):
+        """Categories referenced by the rows serialized so far, keyed by id"""
+        return {str(pk): self.catalogue[pk] for pk in sorted(self.referenced)}
+
+class DoctorValuesSerializer(ValuesSerializer):
+    """Lean counterpart of DoctorSerializer for list endpoints"""
+    fields = {
+        'id': ('id', None),
+        'employee_id': ('employee_id', None),
+        'firstName': ('user__first_name', None),
+        'lastName': ('user__last_name', None),
+        'email': ('user__email', None),
+        'specialization': ('specialization', None),
+        'is_active': ('is_active', None),
+        'created_at': ('created_at', _datetime),
+        'needs_verification': (None, None),
+    }
+    key_fields = ('is_active',)
+
+    def computed(self, rows):
+        return {'needs_verification': lambda row: not row['is_active']}
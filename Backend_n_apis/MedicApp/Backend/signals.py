@@ -0,0 +1,58 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import invalidate_analytics, invalidate_category_cache, invalidate_doctor_stats, invalidate_user_cache
+from .models import Patient, Doctor, Category
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, **kwargs):
+    invalidate_category_cache()
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def patient_changed(sender, **kwargs):
+    invalidate_analytics()
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def doctor_changed(sender, **kwargs):
+    invalidate_doctor_stats()
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Drop the copy cached for JWT authentication so deactivations, password
+    # changes and verifications apply to the very next request.
+    invalidate_user_cache(instance.pk)
+
+
+# Patient.created_at (auto_now) and Doctor.updated_at double as the
+# Last-Modified stamps for conditional GETs, so they are bumped when a
+# patient's programs or a doctor's user account change as well.
+
+@receiver(m2m_changed, sender=Patient.categories.through)
+def patient_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    now = timezone.now()
+    if action.startswith('post_'):
+        invalidate_analytics()
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        Patient.objects.filter(pk=instance.pk).update(created_at=now)
+    elif reverse and action in ('post_add', 'post_remove'):
+        Patient.objects.filter(pk__in=pk_set).update(created_at=now)
+    elif reverse and action == 'pre_clear':
+        instance.patients.update(created_at=now)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    # The cascade through the m2m table sends no m2m_changed
+    instance.patients.update(created_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    Doctor.objects.filter(user_id=instance.pk).update(updated_at=timezone.now())
@@ -0,0 +1,155 @@
+import random
+from datetime import date, timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from .cache import invalidate_analytics, invalidate_category_cache, invalidate_doctor_stats
+from .importers import calculate_age
+from .models import Category, Doctor, Patient
+
+DEFAULT_BATCH_SIZE = 5000
+DOCTOR_PASSWORD = 'synthetic-password'
+
+FIRST_NAMES = (
+    'Amina', 'Brian', 'Cynthia', 'David', 'Esther', 'Felix', 'Grace', 'Hassan', 'Irene', 'James',
+    'Joy', 'Kevin', 'Lucy', 'Mercy', 'Nelson', 'Ochieng', 'Peter', 'Ruth', 'Samuel', 'Wanjiku',
+)
+SURNAMES = (
+    'Achieng', 'Barasa', 'Chebet', 'Kamau', 'Kariuki', 'Kiptoo', 'Mutua', 'Mwangi', 'Njoroge',
+    'Odhiambo', 'Omondi', 'Otieno', 'Wafula', 'Wanjiru', 'Were',
+)
+# (city, relative population) so city filters see a realistic skew
+CITIES = (
+    ('Nairobi', 40), ('Mombasa', 15), ('Kisumu', 10), ('Nakuru', 9), ('Eldoret', 8),
+    ('Thika', 5), ('Machakos', 4), ('Nyeri', 4), ('Kakamega', 3), ('Garissa', 2),
+)
+SPECIALIZATIONS = (
+    'General Practice', 'Pediatrics', 'Cardiology', 'Obstetrics', 'Oncology',
+    'Psychiatry', 'Orthopedics', 'Dermatology',
+)
+PROGRAMS = (
+    'Hypertension', 'Diabetes', 'HIV Care', 'Tuberculosis', 'Maternal Health', 'Immunization',
+    'Malaria', 'Nutrition', 'Mental Health', 'Family Planning', 'Cancer Screening', 'Asthma',
+)
+# How many programs a patient is enrolled in: 0, 1, 2, 3, ...
+PROGRAM_COUNT_WEIGHTS = (30, 40, 20, 10)
+
+
+def _batches(items, size):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def _create_categories(count):
+    names = [PROGRAMS[i] if i < len(PROGRAMS) else f'Program {i + 1}' for i in range(count)]
+    Category.objects.bulk_create(
+        [Category(name=name, description=f'{name} program') for name in names], ignore_conflicts=True
+    )
+    return list(Category.objects.filter(name__in=names).order_by('id').values_list('id', flat=True))
+
+
+def _patients(rng, count, start_patid, today):
+    cities = [city for city, _ in CITIES]
+    weights = [weight for _, weight in CITIES]
+    for i in range(count):
+        dob = today - timedelta(days=rng.randint(0, 95 * 365))
+        yield Patient(
+            PatID=start_patid + i,
+            FName=rng.choice(FIRST_NAMES),
+            MName=rng.choice(FIRST_NAMES),
+            SName=rng.choice(SURNAMES),
+            Age=calculate_age(dob, today),
+            DOB=dob,
+            city=rng.choices(cities, weights)[0],
+        )
+
+
+def _programs_for(rng, category_ids, max_programs):
+    """A few programs per patient, the first programs being the most popular."""
+    counts = range(min(max_programs, len(category_ids)) + 1)
+    weights = [PROGRAM_COUNT_WEIGHTS[min(count, len(PROGRAM_COUNT_WEIGHTS) - 1)] for count in counts]
+    count = rng.choices(counts, weights)[0]
+    popularity = [1 / rank for rank in range(1, len(category_ids) + 1)]
+    chosen = set()
+    while len(chosen) < count:
+        chosen.add(rng.choices(category_ids, popularity)[0])
+    return chosen
+
+
+def generate(patients=10000, doctors=200, categories=len(PROGRAMS), max_programs=3,
+             seed=0, batch_size=DEFAULT_BATCH_SIZE, active_ratio=0.9):
+    """
+    Add synthetic programs, patients (with program memberships) and doctors
+    using bulk inserts, batch_size rows per statement. New PatIDs and
+    employee ids follow the existing ones, so it can be run repeatedly.
+    Every synthetic doctor's password is DOCTOR_PASSWORD.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    category_ids = _create_categories(categories)
+
+    Through = Patient.categories.through
+    start_patid = (Patient.objects.aggregate(last=Max('PatID'))['last'] or 100000) + 1
+    memberships = 0
+    for batch in _batches(_patients(rng, patients, start_patid, today), batch_size):
+        with transaction.atomic():
+            created = Patient.objects.bulk_create(batch)
+            # Some backends don't return primary keys from bulk_create
+            if any(patient.pk is None for patient in created):
+                pks = dict(Patient.objects.filter(PatID__in=[p.PatID for p in batch]).values_list('PatID', 'id'))
+                for patient in created:
+                    patient.pk = pks[patient.PatID]
+            rows = [
+                Through(patient_id=patient.pk, category_id=category_id)
+                for patient in created
+                for category_id in _programs_for(rng, category_ids, max_programs)
+            ]
+            Through.objects.bulk_create(rows, batch_size=batch_size)
+            memberships += len(rows)
+
+    # One hash shared by every synthetic doctor; hashing each would take minutes
+    password = make_password(DOCTOR_PASSWORD)
+    last_username = (
+        User.objects.filter(username__startswith='SYN').order_by('-username').values_list('username', flat=True).first()
+    )
+    first_doctor = int(last_username[3:]) + 1 if last_username else 1
+    for batch in _batches(range(first_doctor, first_doctor + doctors), batch_size):
+        with transaction.atomic():
+            active = {number: rng.random() < active_ratio for number in batch}
+            users = User.objects.bulk_create([
+                User(
+                    username=f'SYN{number:06d}',
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(SURNAMES),
+                    email=f'syn{number:06d}@example.com',
+                    password=password,
+                    is_active=active[number],
+                )
+                for number in batch
+            ])
+            if any(user.pk is None for user in users):
+                users = list(User.objects.filter(username__in=[user.username for user in users]))
+            Doctor.objects.bulk_create([
+                Doctor(
+                    user=user,
+                    employee_id=user.username,
+                    specialization=rng.choice(SPECIALIZATIONS),
+                    is_active=user.is_active,
+                )
+                for user in users
+            ])
+
+    # bulk_create sends no signals, so drop the caches they would have
+    invalidate_category_cache()
+    invalidate_doctor_stats()
+    invalidate_analytics()
+    return {
+        'categories': len(category_ids),
+        'patients': patients,
+        'memberships': memberships,
+        'doctors': doctors,
+    }
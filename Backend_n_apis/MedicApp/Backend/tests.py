@@ -1,3 +1,588 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import signal
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .admin import EstimatedCountPaginator
+from . import hashers
+from .analytics import compute_patient_analytics, get_patient_analytics
+from .cache import existing_category_ids, get_category_ids
+from .enrollment import assign_categories
+from .exporters import EXPORT_COLUMNS, csv_lines, iter_patient_records, ndjson_lines
+from .importers import MAX_REPORTED_ERRORS, PatientImporter, calculate_age, open_rows
+from .models import Category, Doctor, EmailOutbox, Patient
+from .onboarding import DoctorOnboarder, verify_doctors
+from .outbox import MAX_ATTEMPTS, enqueue_mail, send_pending
+from .serializers import PatientValuesSerializer
+
+PATIENT_COUNT = 20000
+DOCTOR_COUNT = 2000
+CITIES = [f'City {i}' for i in range(50)]
+SPECIALIZATIONS = [f'Specialization {i}' for i in range(20)]
+SURNAMES = ['Otieno', 'Wanjiru', 'Kamau', 'Mwangi', 'Achieng', 'Njoroge', 'Odhiambo', 'Kiptoo']
+
+
+def explain(sql):
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def plans(func):
+    """EXPLAIN output for every query `func` runs."""
+    with CaptureQueriesContext(connection) as captured:
+        func()
+    # The captured SQL has its parameters inlined, so re-run it as is
+    return [explain(query['sql']) for query in captured.captured_queries]
+
+
+class QueryPlanTests(TestCase):
+    """
+    Seed enough patients and doctors that the planner prefers an index when a
+    usable one exists, then check the hot API and admin queries still get
+    one. A failure here means an index was dropped or a query stopped being
+    able to use it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([
+            Category(name=f'Program {i}', description='Synthetic program') for i in range(10)
+        ])
+        cls.category = categories[0]
+
+        born = date(1950, 1, 1)
+        Patient.objects.bulk_create([
+            Patient(
+                PatID=100000 + i,
+                FName=f'First{i}',
+                MName='Middle',
+                SName=SURNAMES[i % len(SURNAMES)],
+                Age=0,
+                DOB=born + timedelta(days=i % 25000),
+                city=CITIES[i % len(CITIES)],
+            )
+            for i in range(PATIENT_COUNT)
+        ], batch_size=2000)
+        Through = Patient.categories.through
+        patient_ids = Patient.objects.values_list('id', flat=True)
+        Through.objects.bulk_create([
+            Through(patient_id=pk, category_id=categories[pk % len(categories)].pk) for pk in patient_ids
+        ], batch_size=5000)
+
+        users = User.objects.bulk_create([
+            User(username=f'D{i:05d}', password='!') for i in range(DOCTOR_COUNT)
+        ], batch_size=2000)
+        if any(user.pk is None for user in users):
+            users = User.objects.filter(username__startswith='D').order_by('username')
+        Doctor.objects.bulk_create([
+            Doctor(
+                user=user,
+                employee_id=user.username,
+                specialization=SPECIALIZATIONS[i % len(SPECIALIZATIONS)],
+                # A handful are still waiting for verification
+                is_active=i % 50 != 0,
+            )
+            for i, user in enumerate(users)
+        ], batch_size=2000)
+
+        EmailOutbox.objects.bulk_create([
+            EmailOutbox(subject='Synthetic', body='', recipients=['a@example.com'],
+                        status=EmailOutbox.PENDING if i % 100 == 0 else EmailOutbox.SENT)
+            for i in range(5000)
+        ], batch_size=2000)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, plan, table, index=None):
+        """
+        `plan` reads `table` through an index (`index` when given) rather
+        than scanning the whole table.
+        """
+        if connection.vendor == 'sqlite':
+            full_scan = re.search(rf'\bSCAN {table}\s*$', plan, re.MULTILINE)
+        else:
+            full_scan = re.search(rf'Seq Scan on "?{table}"?', plan)
+        self.assertIsNone(full_scan, f'{table} is scanned sequentially:\n{plan}')
+        if index:
+            self.assertIn(index, plan)
+
+    def test_patient_list_page(self):
+        [plan] = plans(lambda: list(Patient.objects.order_by('PatID')[:51]))
+        self.assertUsesIndex(plan, 'Backend_patient')
+
+    def test_patient_city_filter(self):
+        [plan] = plans(lambda: list(Patient.objects.filter(city='City 7').order_by('PatID')[:51]))
+        self.assertUsesIndex(plan, 'Backend_patient', 'patient_city_patid_idx')
+
+    def test_patient_created_after_filter(self):
+        since = timezone.now() + timedelta(days=1)
+        [plan] = plans(lambda: Patient.objects.filter(created_at__gte=since).count())
+        self.assertUsesIndex(plan, 'Backend_patient', 'patient_created_at_idx')
+
+    def test_patient_last_modified(self):
+        [plan] = plans(lambda: Patient.objects.aggregate(Max('created_at')))
+        self.assertUsesIndex(plan, 'Backend_patient', 'patient_created_at_idx')
+
+    def test_patient_category_filter(self):
+        [plan] = plans(lambda: list(Patient.objects.filter(categories=self.category).order_by('PatID')[:51]))
+        self.assertUsesIndex(plan, 'Backend_patient_categories')
+
+    def test_patient_detail(self):
+        [plan] = plans(lambda: Patient.objects.filter(PatID=100123).first())
+        self.assertUsesIndex(plan, 'Backend_patient')
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram indexes are Postgres only')
+    def test_patient_name_search(self):
+        [plan] = plans(lambda: list(Patient.objects.filter(FName__istartswith='first1234')[:25]))
+        self.assertUsesIndex(plan, 'Backend_patient', 'patient_fname_trgm')
+
+    def test_doctor_specialization_filter(self):
+        [plan] = plans(lambda: list(Doctor.objects.filter(specialization='Specialization 3')))
+        self.assertUsesIndex(plan, 'Backend_doctor', 'doctor_spec_active_idx')
+
+    def test_doctors_pending_verification(self):
+        [plan] = plans(lambda: list(Doctor.objects.filter(is_active=False).order_by('created_at')))
+        self.assertUsesIndex(plan, 'Backend_doctor', 'doctor_pending_idx')
+
+    def test_doctor_last_modified(self):
+        [plan] = plans(lambda: Doctor.objects.aggregate(Max('updated_at')))
+        self.assertUsesIndex(plan, 'Backend_doctor', 'doctor_updated_at_idx')
+
+    def test_outbox_due_batch(self):
+        query = lambda: list(
+            EmailOutbox.objects.filter(status=EmailOutbox.PENDING, next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at')[:100]
+        )
+        [plan] = plans(query)
+        self.assertUsesIndex(plan, 'Backend_emailoutbox', 'outbox_due_idx')
+
+
+class AdminChangelistTests(TestCase):
+    """Changelist pages run a fixed number of queries however many rows they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([Category(name=f'Program {i}') for i in range(5)])
+        for i in range(60):
+            patient = Patient.objects.create(PatID=200000 + i, FName='First', MName='Middle', SName='Surname',
+                                             Age=30, DOB=date(1994, 1, 1), city=CITIES[i % 5])
+            patient.categories.set(categories[:i % 3 + 1])
+            user = User.objects.create(username=f'DR{i:03d}', first_name='Dr', last_name=f'No {i}')
+            Doctor.objects.create(user=user, employee_id=user.username, specialization=SPECIALIZATIONS[i % 4])
+        cls.admin = User.objects.create_superuser('root', 'root@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, model, query=''):
+        url = reverse(f'admin:Backend_{model}_changelist') + query
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_patient_changelist(self):
+        # The first page also fills the program and city filter caches
+        self.assertLessEqual(self.changelist_queries('patient'), 7)
+        # then: session, user, count, page, the page's programs
+        self.assertLessEqual(self.changelist_queries('patient'), 5)
+        self.assertLessEqual(self.changelist_queries('patient', '?city=City%201&q=Sur'), 5)
+
+    def test_doctor_changelist(self):
+        self.assertLessEqual(self.changelist_queries('doctor'), 5)
+
+    def test_small_results_are_counted_exactly(self):
+        self.assertEqual(EstimatedCountPaginator(Patient.objects.order_by('PatID'), 25).count, 60)
+
+
+class CategoryCacheTests(TestCase):
+
+    def test_category_missing_from_a_stale_catalogue_is_kept(self):
+        known = Category.objects.create(name='Known')
+        get_category_ids()
+        # As if created through another worker: this process's catalogue never heard of it
+        [new] = Category.objects.bulk_create([Category(name='New')])
+        if new.pk is None:
+            new = Category.objects.get(name='New')
+        self.assertNotIn(new.pk, get_category_ids())
+
+        self.assertEqual(existing_category_ids([known.pk, new.pk, 999999, 'x']), [known.pk, new.pk])
+        # and the catalogue is reloaded
+        self.assertIn(new.pk, get_category_ids())
+
+    def stale_category(self):
+        """A patient in a category this process's catalogue doesn't know yet."""
+        known = Category.objects.create(name='Known')
+        get_category_ids()
+        [new] = Category.objects.bulk_create([Category(name='New')])
+        if new.pk is None:
+            new = Category.objects.get(name='New')
+        patient = Patient.objects.create(PatID=1, FName='First', MName='Middle', SName='Surname',
+                                         Age=30, DOB=date(1994, 1, 1), city='Nairobi')
+        patient.categories.add(known, new)
+        self.assertNotIn(new.pk, get_category_ids())
+        return known, new
+
+    def test_serializer_keeps_categories_missing_from_a_stale_catalogue(self):
+        known, new = self.stale_category()
+        serializer = PatientValuesSerializer()
+        [patient] = serializer.to_representation(serializer.values(Patient.objects.all()))
+        self.assertEqual([category['name'] for category in patient['categories']], ['Known', 'New'])
+        self.assertIn(new.pk, get_category_ids())
+
+    def test_normalized_serializer_side_loads_categories_missing_from_a_stale_catalogue(self):
+        known, new = self.stale_category()
+        serializer = PatientValuesSerializer(normalized=True)
+        [patient] = serializer.to_representation(serializer.values(Patient.objects.all()))
+        self.assertEqual(patient['category_ids'], [known.pk, new.pk])
+        self.assertEqual(serializer.side_loaded_categories()[str(new.pk)]['name'], 'New')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+
+    def test_delivered_message_is_blanked(self):
+        message = enqueue_mail('Credentials', 'Password: secret', ['dr@example.com'])
+        self.assertEqual(send_pending(), (1, 0))
+        self.assertEqual(mail.outbox[0].body, 'Password: secret')
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.body), (EmailOutbox.SENT, ''))
+
+    def test_message_that_keeps_failing_is_blanked(self):
+        message = enqueue_mail('Credentials', 'Password: secret', ['dr@example.com'])
+        with mock.patch('Backend.outbox.get_connection') as get_connection:
+            get_connection.return_value.send_messages.side_effect = OSError('Connection refused')
+            for attempt in range(MAX_ATTEMPTS):
+                EmailOutbox.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+                self.assertEqual(send_pending(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts, message.body), (EmailOutbox.FAILED, MAX_ATTEMPTS, ''))
+
+    def test_claimed_batch_is_leased(self):
+        enqueue_mail('Hello', 'Body', ['dr@example.com'])
+        with mock.patch('Backend.outbox.get_connection') as get_connection:
+            # Another sender looking for work while this one delivers finds none
+            get_connection.return_value.send_messages.side_effect = lambda messages: self.assertEqual(
+                send_pending(), (0, 0))
+            self.assertEqual(send_pending(), (1, 0))
+
+
+def doctor_row(employee_id, **fields):
+    return {'employee_id': employee_id, 'email': f'{employee_id.lower()}@example.com',
+            'firstName': 'Amina', 'lastName': 'Otieno', 'specialization': 'Oncology', **fields}
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DoctorOnboardingTests(TestCase):
+
+    def onboard(self, rows, verified=True):
+        return DoctorOnboarder(chunk_size=3, verified=verified, workers=1).run(rows)
+
+    def test_verified_doctors_get_credentials(self):
+        summary = self.onboard([doctor_row('ONB1'), doctor_row('ONB2')])
+        self.assertEqual(summary, {'created': 2, 'failed': 0, 'errors': []})
+
+        doctor = Doctor.objects.select_related('user').get(employee_id='ONB1')
+        self.assertTrue(doctor.is_active and doctor.user.is_active)
+        self.assertEqual((doctor.user.email, doctor.specialization), ('onb1@example.com', 'Oncology'))
+        message = EmailOutbox.objects.get(recipients=['onb1@example.com'])
+        password = re.search(r'Password: (\S+)', message.body).group(1)
+        self.assertTrue(check_password(password, doctor.user.password))
+
+    def test_pending_doctors_get_no_password_or_email(self):
+        self.assertEqual(self.onboard([doctor_row('PEN1')], verified=False)['created'], 1)
+        doctor = Doctor.objects.select_related('user').get(employee_id='PEN1')
+        self.assertFalse(doctor.is_active or doctor.user.is_active)
+        self.assertFalse(doctor.user.has_usable_password())
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        User.objects.create(username='TAKEN1')
+        taken = User.objects.create(username='TAKEN2')
+        Doctor.objects.create(user=taken, employee_id='TAKEN3')
+        rows = [
+            doctor_row('OK1'),
+            doctor_row('OK1'),
+            doctor_row('NOEMAIL', email=''),
+            doctor_row('BADMAIL', email='not-an-email'),
+            doctor_row('X' * 51),
+            doctor_row('TAKEN1'),
+            doctor_row('TAKEN3'),
+            doctor_row('OK2'),
+        ]
+        summary = self.onboard(rows)
+        self.assertEqual((summary['created'], summary['failed']), (2, 6))
+        self.assertEqual([error['row'] for error in summary['errors']], [2, 3, 4, 5, 6, 7])
+        self.assertIn('Duplicate', summary['errors'][0]['detail'])
+        self.assertIn('Missing fields: email', summary['errors'][1]['detail'])
+        self.assertIn('Invalid email', summary['errors'][2]['detail'])
+        self.assertIn('employee_id must be at most 50', summary['errors'][3]['detail'])
+        self.assertIn('already exists', summary['errors'][4]['detail'])
+        self.assertIn('already exists', summary['errors'][5]['detail'])
+        self.assertEqual(
+            set(Doctor.objects.filter(employee_id__startswith='OK').values_list('employee_id', flat=True)),
+            {'OK1', 'OK2'},
+        )
+
+
+class HasherPoolTests(TestCase):
+
+    def tearDown(self):
+        for workers, pool in list(hashers._pools.items()):
+            hashers._discard_pool(workers, pool)
+
+    def test_pool_with_a_dead_worker_is_replaced(self):
+        hashers.make_passwords(['first', 'second'], 2)
+        pool = hashers._pools[2]
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+
+        encoded = hashers.make_passwords(['third', 'fourth'], 2)
+        self.assertTrue(check_password('fourth', encoded[1]))
+        self.assertIsNot(hashers._pools[2], pool)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class VerifyDoctorsTests(TestCase):
+
+    def setUp(self):
+        DoctorOnboarder(verified=False, workers=1).run([doctor_row(f'PEN{i}') for i in range(4)])
+        DoctorOnboarder(workers=1).run([doctor_row('ACTIVE')])
+        # PEN0 has waited longest
+        for i in range(4):
+            Doctor.objects.filter(employee_id=f'PEN{i}').update(created_at=timezone.now() - timedelta(days=4 - i))
+        EmailOutbox.objects.all().delete()
+
+    def test_result_per_id(self):
+        results = verify_doctors(['PEN0', 'PEN1', 'ACTIVE', 'MISSING'], workers=1)
+        self.assertEqual(results, {'PEN0': 'verified', 'PEN1': 'verified',
+                                   'ACTIVE': 'already_active', 'MISSING': 'not_found'})
+
+        self.assertEqual(
+            set(Doctor.objects.filter(is_active=True).values_list('employee_id', flat=True)),
+            {'PEN0', 'PEN1', 'ACTIVE'},
+        )
+        user = User.objects.get(username='PEN1')
+        self.assertTrue(user.is_active)
+        [message] = EmailOutbox.objects.filter(recipients=['pen1@example.com'])
+        password = re.search(r'Password: (\S+)', message.body).group(1)
+        self.assertTrue(check_password(password, user.password))
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_all_pending_oldest_first_up_to_the_limit(self):
+        results = verify_doctors(chunk_size=2, workers=1, limit=3)
+        self.assertEqual(results, dict.fromkeys(['PEN0', 'PEN1', 'PEN2'], 'verified'))
+        self.assertEqual(list(Doctor.objects.filter(is_active=False).values_list('employee_id', flat=True)), ['PEN3'])
+
+    def test_doctor_verified_concurrently_is_left_alone(self):
+        def verified_elsewhere(passwords, workers):
+            # Another admin verifies PEN1 while this batch's passwords are hashed
+            User.objects.filter(username='PEN1').update(is_active=True, password='elsewhere')
+            Doctor.objects.filter(employee_id='PEN1').update(is_active=True)
+            return hashers.make_passwords(passwords, workers)
+
+        with mock.patch('Backend.onboarding.make_passwords', side_effect=verified_elsewhere):
+            results = verify_doctors(['PEN0', 'PEN1'], workers=1)
+        self.assertEqual(results, {'PEN0': 'verified', 'PEN1': 'already_active'})
+        self.assertEqual(User.objects.get(username='PEN1').password, 'elsewhere')
+        self.assertFalse(EmailOutbox.objects.filter(recipients=['pen1@example.com']).exists())
+
+
+class PatientSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for patid, first, middle, surname, city in [
+            (12, 'Amina', 'Wairimu', 'Kamau', 'Nairobi'),
+            (123, 'Kamal', 'Juma', 'Otieno', 'Kisumu'),
+            (1250, 'Brian', 'Kamau', 'Njoroge', 'Nakuru'),
+            (212, 'Grace', 'Akinyi', 'Mwangi', 'Kampala'),
+            (5, 'Peter', 'Mutua', 'Kiptoo', 'Eldoret'),
+        ]:
+            Patient.objects.create(PatID=patid, FName=first, MName=middle, SName=surname,
+                                   Age=30, DOB=date(1994, 1, 1), city=city)
+
+    def search(self, query):
+        return list(Patient.objects.search(query).values_list('PatID', flat=True))
+
+    def test_prefix_matches_ranked_surname_first_name_middle_name_city(self):
+        self.assertEqual(self.search('kam'), [12, 123, 1250, 212])
+        self.assertEqual(self.search('KAMAL'), [123])
+
+    def test_city_prefix(self):
+        self.assertEqual(self.search('nai'), [12])
+
+    def test_patid_prefix_ranges(self):
+        # exact PatID first, then the other PatIDs starting with 12; not 212
+        self.assertEqual(self.search('12'), [12, 123, 1250])
+        self.assertEqual(self.search('125'), [1250])
+        self.assertEqual(self.search('012'), [])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('amina kam'), [12])
+        self.assertEqual(self.search('amina otieno'), [])
+
+    def test_blank_query_matches_nothing(self):
+        self.assertEqual(self.search('   '), [])
+
+
+class PatientImportTests(TestCase):
+
+    def test_bad_rows_are_reported_and_the_rest_imported(self):
+        category = Category.objects.create(name='Diabetes')
+        Patient.objects.create(PatID=5, FName='Old', MName='Old', SName='Old', Age=1, DOB=date(2020, 1, 1), city='X')
+        csv_file = io.BytesIO(
+            'PatID,FName,MName,SName,DOB,city,category_ids\n'
+            f'1,Amina,W,Kamau,1990-05-17,Nairobi,{category.pk}\n'
+            '2,Brian,K,Otieno,17/05/1990,Kisumu,\n'
+            '3,Grace,,Mwangi,1990-05-17,Nakuru,\n'
+            '4,Peter,M,Kiptoo,1990-05-17,Eldoret,999999\n'
+            '1,Amina,W,Kamau,1990-05-17,Nairobi,\n'
+            '5,Taken,T,Taken,1990-05-17,Nyeri,\n'
+            'x,Bad,B,Bad,1990-05-17,Nyeri,\n'
+            '6,Jane,A,Njoroge,1985-01-02,Garissa,\n'.encode()
+        )
+        summary = PatientImporter(chunk_size=5).run(open_rows(csv_file, 'csv'))
+
+        self.assertEqual((summary['created'], summary['failed']), (2, 6))
+        self.assertEqual([error['row'] for error in summary['errors']], [2, 3, 4, 5, 6, 7])
+        for error, expected in zip(summary['errors'], [
+            'Invalid date format', 'Missing fields: MName', 'Unknown category ids: 999999',
+            'Duplicate patient ID', 'already exists', 'must be a number',
+        ]):
+            self.assertIn(expected, error['detail'])
+        self.assertEqual(set(Patient.objects.values_list('PatID', flat=True)), {1, 5, 6})
+        self.assertEqual(list(Patient.objects.get(PatID=1).categories.all()), [category])
+
+    def test_failed_chunk_is_retried_row_by_row(self):
+        # Another import takes PatID 2 after this one checked for existing ids
+        Patient.objects.create(PatID=2, FName='Old', MName='Old', SName='Old', Age=1, DOB=date(2020, 1, 1), city='X')
+        rows = [{'PatID': patid, 'FName': 'F', 'MName': 'M', 'SName': 'S', 'DOB': '1990-01-01', 'city': 'C'}
+                for patid in (1, 2, 3)]
+        nothing = Patient.objects.none()
+        with mock.patch.object(Patient.objects, 'filter', return_value=nothing):
+            summary = PatientImporter().run(rows)
+
+        self.assertEqual((summary['created'], summary['failed']), (2, 1))
+        self.assertEqual(summary['errors'][0]['row'], 2)
+        self.assertEqual(set(Patient.objects.values_list('PatID', flat=True)), {1, 2, 3})
+
+    def test_reported_errors_are_capped(self):
+        rows = [{'PatID': 'x'}] * (MAX_REPORTED_ERRORS + 5)
+        rows.append({'PatID': 1, 'FName': 'F', 'MName': 'M', 'SName': 'S', 'DOB': '1990-01-01', 'city': 'C'})
+        summary = PatientImporter().run(rows)
+        self.assertEqual((summary['created'], summary['failed']), (1, MAX_REPORTED_ERRORS + 5))
+        self.assertEqual(len(summary['errors']), MAX_REPORTED_ERRORS)
+
+
+class PatientExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        diabetes, asthma = Category.objects.bulk_create([Category(name='Diabetes'), Category(name='Asthma')])
+        for i in range(5):
+            patient = Patient.objects.create(PatID=10 + i, FName=f'First{i}', MName='Middle', SName='Surname',
+                                             Age=0, DOB=date(1990, 5, 17), city='Nairobi' if i % 2 else 'Kisumu')
+            patient.categories.set([diabetes, asthma][:i % 3])
+
+    def test_records_load_programs_with_one_query_per_chunk(self):
+        # The patients themselves, then the memberships of chunks of 2, 2 and 1
+        with self.assertNumQueries(4):
+            records = list(iter_patient_records(Patient.objects.all(), chunk_size=2))
+        self.assertEqual([record['PatID'] for record in records], [10, 11, 12, 13, 14])
+        self.assertEqual([record['programs'] for record in records],
+                         [[], ['Diabetes'], ['Asthma', 'Diabetes'], [], ['Diabetes']])
+        self.assertEqual(records[0]['Age'], calculate_age(date(1990, 5, 17), date.today()))
+
+    def test_csv(self):
+        lines = ''.join(csv_lines(iter_patient_records(Patient.objects.filter(city='Nairobi'))))
+        rows = list(csv.DictReader(io.StringIO(lines)))
+        self.assertEqual(list(rows[0]), list(EXPORT_COLUMNS))
+        self.assertEqual([(row['PatID'], row['DOB'], row['programs']) for row in rows],
+                         [('11', '1990-05-17', 'Diabetes'), ('13', '1990-05-17', '')])
+
+    def test_ndjson(self):
+        lines = list(ndjson_lines(iter_patient_records(Patient.objects.filter(PatID=12))))
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual((record['FName'], record['DOB'], record['programs']),
+                         ('First2', '1990-05-17', ['Asthma', 'Diabetes']))
+
+
+class PatientAnalyticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.diabetes = Category.objects.create(name='Diabetes')
+        cls.asthma = Category.objects.create(name='Asthma')
+        for patid, dob, city, categories in (
+            (1, date(2010, 1, 1), 'Nairobi', [cls.diabetes]),
+            (2, date(2006, 6, 1), 'Nairobi', []),
+            (3, date(1980, 1, 1), 'Kisumu', [cls.diabetes, cls.asthma]),
+            (4, date(1940, 1, 1), 'Mombasa', [cls.asthma]),
+        ):
+            patient = Patient.objects.create(PatID=patid, FName='First', MName='Middle', SName='Surname',
+                                             Age=0, DOB=dob, city=city)
+            patient.categories.set(categories)
+
+    def programs(self, analytics):
+        return {program['name']: program['count'] for program in analytics['by_program']}
+
+    def test_breakdowns(self):
+        analytics = compute_patient_analytics(Patient.objects.all(), today=date(2024, 6, 1))
+        self.assertEqual(analytics['total'], 4)
+        self.assertEqual(self.programs(analytics), {'Diabetes': 2, 'Asthma': 2})
+        self.assertEqual(analytics['by_city'][0], {'city': 'Nairobi', 'count': 2})
+        self.assertEqual(len(analytics['by_city']), 3)
+        # Turning 18 today puts patient 2 in the adult bracket
+        self.assertEqual({row['bracket']: row['count'] for row in analytics['by_age']},
+                         {'0-17': 1, '18-29': 1, '30-44': 1, '45-59': 0, '60-74': 0, '75+': 1})
+
+    def test_filtered(self):
+        analytics = compute_patient_analytics(Patient.objects.filter(city='Nairobi'), today=date(2024, 6, 1))
+        self.assertEqual(analytics['total'], 2)
+        self.assertEqual(self.programs(analytics), {'Diabetes': 1, 'Asthma': 0})
+        self.assertEqual(analytics['by_city'], [{'city': 'Nairobi', 'count': 2}])
+
+    def test_cached_analytics_follow_patient_writes(self):
+        def analytics(**params):
+            patients = Patient.objects.filter(city=params['city']) if params else Patient.objects.all()
+            return get_patient_analytics(patients, params)
+
+        self.assertEqual(analytics()['total'], 4)
+        self.assertEqual(analytics(city='Nairobi')['total'], 2)
+
+        patient = Patient.objects.create(PatID=5, FName='First', MName='Middle', SName='Surname',
+                                         Age=0, DOB=date(1990, 1, 1), city='Nairobi')
+        self.assertEqual(analytics()['total'], 5)
+        self.assertEqual(analytics(city='Nairobi')['total'], 3)
+
+        patient.categories.add(self.asthma)
+        self.assertEqual(self.programs(analytics())['Asthma'], 3)
+
+        assign_categories(Patient.objects.filter(city='Nairobi'), add=[self.diabetes.pk])
+        self.assertEqual(self.programs(analytics(city='Nairobi'))['Diabetes'], 3)
+
+        PatientImporter().run([{'PatID': '6', 'FName': 'A', 'MName': 'B', 'SName': 'C',
+                                'DOB': '1990-01-01', 'city': 'Kisumu', 'category_ids': []}])
+        self.assertEqual(analytics()['total'], 6)
+
+        patient.delete()
+        self.assertEqual(analytics()['total'], 5)
@@ -0,0 +1,75 @@
+import time
+
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from Backend.cache import AUTH_USER_RECHECK_INTERVAL, AUTH_USER_TIMEOUT, record, user_cache_key
+from .revocation import is_revoked
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the token's user in the cache for
+    AUTH_USER_CACHE_TIMEOUT seconds instead of loading it on every request.
+    The entry is dropped whenever the User is saved or deleted (see
+    Backend.signals), so is_active and password changes apply immediately
+    in the same process. Other processes, and writes that skip signals such
+    as QuerySet.update(), are covered by re-reading is_active and the
+    password once the entry is AUTH_USER_RECHECK_INTERVAL seconds old.
+    Access tokens are also checked against the revocation registry, so
+    logging out takes effect before they expire.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if is_revoked(validated_token):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+        key = user_cache_key(user_id)
+        entry = cache.get(key)
+        record('auth_user', entry is not None)
+        now = time.time()
+        if entry is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, (user, now, now), AUTH_USER_TIMEOUT)
+        else:
+            user, loaded_at, checked_at = entry
+            if now - checked_at > AUTH_USER_RECHECK_INTERVAL:
+                user = self._recheck(key, user, loaded_at, now)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+    def _recheck(self, key, user, loaded_at, now):
+        """
+        Refresh the fields authentication depends on. The entry may have
+        been cached by a process that never saw the change (locmem is per
+        process), so this bounds how late a deactivation or password change
+        applies to AUTH_USER_RECHECK_INTERVAL.
+        """
+        current = self.user_model.objects.filter(pk=user.pk).values_list('is_active', 'password').first()
+        if current is None:
+            cache.delete(key)
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        user.is_active, user.password = current
+        # Still dropped AUTH_USER_CACHE_TIMEOUT after it was first loaded
+        remaining = AUTH_USER_TIMEOUT - (now - loaded_at)
+        if remaining > 0:
+            cache.set(key, (user, loaded_at, now), remaining)
+        return user
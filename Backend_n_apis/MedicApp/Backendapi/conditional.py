@@ -0,0 +1,81 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from Backend.models import Category, Patient, Doctor
+
+
+def conditional(state_func):
+    """
+    Django's @condition with the ETag and Last-Modified both derived from a
+    single `state_func(request, *args, **kwargs)` call, which returns a tuple
+    starting with the last-modified datetime (or None if there is nothing to
+    validate). The ETag also covers the query string and Accept header, so
+    each page and variant of a resource validates separately. Responses are
+    marked no-cache so clients revalidate every time instead of trusting
+    heuristic freshness.
+    """
+    def decorator(view):
+        def state(request, *args, **kwargs):
+            if not hasattr(request, '_conditional_state'):
+                request._conditional_state = state_func(request, *args, **kwargs)
+            return request._conditional_state
+
+        def etag(request, *args, **kwargs):
+            current = state(request, *args, **kwargs)
+            if current is None:
+                return None
+            # The representation also depends on the query string (page,
+            # fields, filters) and the negotiated media type
+            key = repr((current, request.get_full_path(), request.META.get('HTTP_ACCEPT')))
+            return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+        def last_modified(request, *args, **kwargs):
+            current = state(request, *args, **kwargs)
+            return current[0] if current else None
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Accept',))
+            return response
+        return wrapper
+    return decorator
+
+
+def _category_state():
+    """
+    When any category was last changed, and how many there are, read from
+    the database so every worker derives the same validators. Deleting a
+    category bumps its patients' created_at (see Backend.signals).
+    """
+    stats = Category.objects.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return stats['last_modified'], stats['count']
+
+
+def patient_list_state(request, *args, **kwargs):
+    stats = Patient.objects.aggregate(last_modified=Max('created_at'), count=Count('id'))
+    category_modified, category_count = _category_state()
+    last_modified = max(filter(None, [stats['last_modified'], category_modified]), default=None)
+    return last_modified, stats['count'], category_count
+
+
+def patient_detail_state(request, patient_id, *args, **kwargs):
+    try:
+        modified = Patient.objects.filter(PatID=int(patient_id)).values_list('created_at', flat=True).first()
+    except ValueError:
+        return None
+    if modified is None:
+        return None
+    category_modified, category_count = _category_state()
+    return max(filter(None, [modified, category_modified])), category_count
+
+
+def doctor_list_state(request, *args, **kwargs):
+    stats = Doctor.objects.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return stats['last_modified'], stats['count']
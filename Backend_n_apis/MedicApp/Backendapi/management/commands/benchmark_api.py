@@ -0,0 +1,344 @@
+import itertools
+import json
+import os
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+from Backend.models import Category, Doctor, Patient
+from Backend.synthetic import DOCTOR_PASSWORD, SURNAMES, generate
+from Backendapi.management.commands.benchmark_login import percentile, run_concurrently
+from Backendapi.throttling import LoginIPThrottle, LoginUsernameThrottle
+from Backendapi.tokens import tokens_for_user
+from Backendapi.urls import urlpatterns
+
+ADMIN_USERNAME = 'benchmark-admin'
+# Sent as both cookie and header, like a browser client, for the views CSRF applies to
+CSRF_TOKEN = 'benchmarkcsrfbenchmarkcsrfbenchm'
+# Requests measured one at a time under tracemalloc for the peak memory column
+MEMORY_SAMPLES = 20
+# Requests that can't succeed here would only time an error: verify-admin
+# passes only before the admin account the admin endpoints need exists, and
+# POST doctors can't create a doctor without a user (register-doc does)
+NOT_BENCHMARKED = {'verify-admin'}
+
+
+class Context:
+    """Users, tokens and ids the request builders draw from."""
+
+    def __init__(self, admin, doctor):
+        self.admin = admin
+        self.doctor = doctor
+        self.patids = list(Patient.objects.values_list('PatID', flat=True))
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+        self.doctors = list(Doctor.objects.filter(is_active=True).values_list('employee_id', flat=True))
+        self.counter = itertools.count(1)
+        self.refresh_tokens()
+
+    def refresh_tokens(self):
+        self.admin_token = str(tokens_for_user(self.admin).access_token)
+        self.doctor_token = str(tokens_for_user(self.doctor).access_token)
+
+    def unique(self, prefix):
+        return f'{prefix}{next(self.counter):07d}'
+
+    def new_user(self, prefix, **fields):
+        return User.objects.create(username=self.unique(prefix), password=make_password(None), **fields)
+
+
+def environ(method, name, kwargs=None, query=None, data=None, token=None, content_type='application/json'):
+    """WSGI environ for a request to the named route."""
+    body = b''
+    if data is not None:
+        body = data if isinstance(data, bytes) else json.dumps(data).encode()
+    env = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': reverse(name, kwargs=kwargs),
+        'QUERY_STRING': urlencode(query or {}),
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': BytesIO(body),
+        'HTTP_HOST': 'testserver',
+        'HTTP_COOKIE': f'csrftoken={CSRF_TOKEN}',
+        'HTTP_X_CSRFTOKEN': CSRF_TOKEN,
+    }
+    if token:
+        env['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    setup_testing_defaults(env)
+    return env
+
+
+def patient_fields(ctx, rng):
+    return {
+        'FName': 'Bench', 'MName': 'Mark', 'SName': rng.choice(SURNAMES),
+        'DOB': '1990-05-17', 'city': 'Nairobi',
+        'category_ids': rng.sample(ctx.category_ids, min(2, len(ctx.category_ids))),
+    }
+
+
+def import_csv(ctx, rows=100):
+    start = 900000000 + next(ctx.counter) * rows
+    lines = ['PatID,FName,MName,SName,DOB,city']
+    lines += [f'{start + i},Bench,Mark,Import,1985-01-{i % 28 + 1:02d},Kisumu' for i in range(rows)]
+    upload = SimpleUploadedFile('patients.csv', '\n'.join(lines).encode(), content_type='text/csv')
+    return encode_multipart(BOUNDARY, {'file': upload})
+
+
+def pending_doctor(ctx):
+    user = ctx.new_user('PEND', email='pending@example.com', is_active=False)
+    Doctor.objects.create(user=user, employee_id=user.username, specialization='Pediatrics', is_active=False)
+    return user.username
+
+
+# "<url name> <METHOD>" -> builds the environ of one request
+ENDPOINTS = {
+    'login POST': lambda ctx, rng: environ(
+        'POST', 'login', data={'employee_id': rng.choice(ctx.doctors), 'password': DOCTOR_PASSWORD}),
+    'logout POST': lambda ctx, rng: (lambda refresh: environ(
+        'POST', 'logout', data={'refresh': str(refresh)}, token=str(refresh.access_token))
+    )(tokens_for_user(ctx.new_user('OUT'))),
+    'logout-all POST': lambda ctx, rng: environ(
+        'POST', 'logout-all', token=str(tokens_for_user(ctx.new_user('OUTALL')).access_token)),
+    'register POST': lambda ctx, rng: environ('POST', 'register', data={
+        'employee_id': ctx.unique('REG'), 'firstName': 'Bench', 'lastName': 'Mark',
+        'email': 'register@example.com', 'specialization': 'Oncology'}),
+    'admin-register POST': lambda ctx, rng: environ('POST', 'admin-register', data={
+        'employee_id': ctx.unique('ADM'), 'email': 'admin@example.com', 'password': DOCTOR_PASSWORD}),
+    'register-doc POST': lambda ctx, rng: environ('POST', 'register-doc', data={
+        'employee_id': ctx.unique('DOC'), 'firstName': 'Bench', 'lastName': 'Mark',
+        'email': 'doctor@example.com', 'specialization': 'Cardiology', 'is_verified': True}),
+    'token_refresh POST': lambda ctx, rng: environ(
+        'POST', 'token_refresh', data={'refresh': str(tokens_for_user(ctx.doctor))}),
+    'patient GET': lambda ctx, rng: environ('GET', 'patient'),
+    'patient POST': lambda ctx, rng: environ('POST', 'patient', data={
+        **patient_fields(ctx, rng), 'PatID': 800000000 + next(ctx.counter)}),
+    'patient-search GET': lambda ctx, rng: environ(
+        'GET', 'patient-search', query={'q': rng.choice(SURNAMES)[:4]}),
+    'patient-import POST': lambda ctx, rng: environ(
+        'POST', 'patient-import', data=import_csv(ctx), token=ctx.doctor_token, content_type=MULTIPART_CONTENT),
+    'patient-export GET': lambda ctx, rng: environ(
+        'GET', 'patient-export', query={'city': 'Nyeri'}, token=ctx.doctor_token),
+    'patient-analytics GET': lambda ctx, rng: environ('GET', 'patient-analytics', token=ctx.doctor_token),
+    'patient-programs POST': lambda ctx, rng: environ('POST', 'patient-programs', token=ctx.doctor_token, data={
+        'filter': {'city': rng.choice(['Nyeri', 'Garissa'])}, 'add': rng.sample(ctx.category_ids, 1)}),
+    'patient-detail GET': lambda ctx, rng: environ(
+        'GET', 'patient-detail', kwargs={'patient_id': rng.choice(ctx.patids)}),
+    'update-patient-credentials POST': lambda ctx, rng: environ(
+        'POST', 'update-patient-credentials', kwargs={'patient_id': rng.choice(ctx.patids)},
+        data=patient_fields(ctx, rng)),
+    'doctors GET': lambda ctx, rng: environ('GET', 'doctors', token=ctx.doctor_token),
+    'doctors PUT': lambda ctx, rng: environ('PUT', 'doctors', token=ctx.doctor_token, data={
+        'employee_id': rng.choice(ctx.doctors), 'specialization': rng.choice(['Oncology', 'Pediatrics'])}),
+    'doctors-onboard POST': lambda ctx, rng: environ('POST', 'doctors-onboard', token=ctx.admin_token, data={
+        'doctors': [{'employee_id': ctx.unique('ONB'), 'email': 'onboard@example.com', 'firstName': 'Bench',
+                     'lastName': 'Mark', 'specialization': 'Oncology'} for _ in range(5)]}),
+    'verify-doctor POST': lambda ctx, rng: environ(
+        'POST', 'verify-doctor', kwargs={'user_id': pending_doctor(ctx)}, token=ctx.admin_token),
+    'verify-doctors POST': lambda ctx, rng: environ('POST', 'verify-doctors', token=ctx.admin_token, data={
+        'employee_ids': [pending_doctor(ctx) for _ in range(5)]}),
+    'doctor-stats GET': lambda ctx, rng: environ('GET', 'doctor-stats', token=ctx.doctor_token),
+    'categories GET': lambda ctx, rng: environ('GET', 'categories', token=ctx.doctor_token),
+    'categories POST': lambda ctx, rng: environ('POST', 'categories', token=ctx.doctor_token, data={
+        'name': ctx.unique('Program '), 'description': 'Benchmark program'}),
+    'category-detail PUT': lambda ctx, rng: environ(
+        'PUT', 'category-detail', kwargs={'pk': Category.objects.create(name=ctx.unique('Program ')).pk},
+        token=ctx.doctor_token, data={'name': ctx.unique('Program '), 'description': 'Renamed'}),
+    'category-detail DELETE': lambda ctx, rng: environ(
+        'DELETE', 'category-detail', kwargs={'pk': Category.objects.create(name=ctx.unique('Program ')).pk},
+        token=ctx.doctor_token),
+    'send-email POST': lambda ctx, rng: environ('POST', 'send-email', data={
+        'employee_id': rng.choice(ctx.doctors), 'email': 'reset@example.com'}),
+    'admin-details GET': lambda ctx, rng: environ('GET', 'admin-details', token=ctx.admin_token),
+    'admin-details PUT': lambda ctx, rng: environ(
+        'PUT', 'admin-details', token=ctx.admin_token, data={'email': 'admin@example.com'}),
+    'cache-stats GET': lambda ctx, rng: environ('GET', 'cache-stats', token=ctx.doctor_token),
+}
+
+
+class Command(BaseCommand):
+    help = ('Load a test database with synthetic data, drive every API route concurrently and report '
+            'requests/sec, p50/p95/p99 latency, SQL queries and peak memory per endpoint as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=100, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--only', help='Comma separated endpoints to run, e.g. "patient,doctors GET"')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Where to save the results, by default '
+                                             'benchmark-results/api-<timestamp>.json')
+        parser.add_argument('--compare', help='Results of an earlier run to print the differences against')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs')
+        parser.add_argument('--throttle', action='store_true',
+                            help='Leave login throttling on; by default it would only measure 429s')
+
+    def handle(self, *args, **options):
+        endpoints = self.selected(options['only'])
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+        self.warn_uncovered()
+
+        throttles = [(throttle, throttle.THROTTLE_RATES) for throttle in (LoginIPThrottle, LoginUsernameThrottle)]
+        if not options['throttle']:
+            for throttle, rates in throttles:
+                throttle.THROTTLE_RATES = {**rates, throttle.scope: None}
+        os.environ.setdefault('AdminCreds', ADMIN_USERNAME)
+
+        # A throwaway test database, so the synthetic rows and everything the
+        # endpoints write never reach the configured one. DEBUG would keep
+        # every query in memory and skew the memory column.
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=1, interactive=False, keepdb=options['keepdb'])
+        try:
+            with override_settings(EMAIL_OUTBOX_BACKGROUND_THREAD=False):
+                results = self.run(endpoints, options)
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=1, keepdb=options['keepdb'])
+            teardown_test_environment()
+            for throttle, rates in throttles:
+                throttle.THROTTLE_RATES = rates
+
+        output = Path(options['output'] or f"benchmark-results/api-{datetime.now():%Y%m%d-%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(f'Saved results to {output}')
+        if previous:
+            self.compare(previous, results)
+
+        failed = [
+            key for key, result in results['endpoints'].items()
+            if any(code.startswith('5') for code in result['statuses'])
+        ]
+        if failed:
+            message = f"Server errors from {', '.join(failed)}; their figures don't measure the endpoint's normal work"
+            if results['database'] == 'sqlite' and options['concurrency'] > 1:
+                message += '. SQLite fails concurrent writes with "database is locked", try --concurrency 1'
+            raise CommandError(message)
+
+    def selected(self, only):
+        if not only:
+            return dict(ENDPOINTS)
+        wanted = [name.strip() for name in only.split(',')]
+        endpoints = {
+            key: build for key, build in ENDPOINTS.items()
+            if key in wanted or key.split()[0] in wanted
+        }
+        if not endpoints:
+            raise CommandError(f'No endpoints match {only}; choose from: {", ".join(ENDPOINTS)}')
+        return endpoints
+
+    def warn_uncovered(self):
+        covered = {key.split()[0] for key in ENDPOINTS}
+        for pattern in urlpatterns:
+            if pattern.name not in covered and pattern.name not in NOT_BENCHMARKED:
+                self.stderr.write(f'No benchmark for the {pattern.name} route ({pattern.pattern})')
+
+    def run(self, endpoints, options):
+        start = time.perf_counter()
+        summary = generate(patients=options['patients'], doctors=options['doctors'], seed=options['seed'])
+        admin, _ = User.objects.get_or_create(username=os.environ['AdminCreds'],
+                                              defaults={'email': 'admin@example.com'})
+        doctor = User.objects.filter(doctor__is_active=True).order_by('pk').first()
+        ctx = Context(admin, doctor)
+        self.stdout.write(
+            f"Generated {summary['patients']} patients, {summary['doctors']} doctors and "
+            f"{summary['categories']} programs in {time.perf_counter() - start:.1f}s"
+        )
+
+        handler = WSGIHandler()
+        rng = random.Random(options['seed'])
+        results = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'data': summary,
+            'endpoints': {},
+        }
+        self.stdout.write(
+            f"{'endpoint':<34}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KB':>9}  statuses"
+        )
+        for key, build in endpoints.items():
+            ctx.refresh_tokens()
+            result = self.measure(handler, lambda: build(ctx, rng), options['requests'], options['concurrency'])
+            results['endpoints'][key] = result
+            statuses = ', '.join(f'{code}: {count}' for code, count in sorted(result['statuses'].items()))
+            self.stdout.write(
+                f"{key:<34}{result['rps']:>9.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                f"{result['p99_ms']:>9.1f}{result['queries']:>9.1f}{result['peak_kb']:>9.0f}  {statuses}"
+            )
+        return results
+
+    def measure(self, handler, build, requests, concurrency):
+        # Requests are built up front so creating their fixtures isn't timed
+        environs = iter([build() for _ in range(requests)])
+
+        def call():
+            queries = []
+            statuses = []
+            # Each thread has its own connection, so this counts this request only
+            with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                response = handler(next(environs), lambda status, headers: statuses.append(status))
+                b''.join(response)
+                response.close()
+            return int(statuses[0].split()[0]), len(queries)
+
+        rate, latencies, outcomes = run_concurrently(call, requests, concurrency)
+        codes = [code for code, _ in outcomes]
+
+        # Peak memory on its own pass, as tracemalloc slows everything down
+        peak = 0
+        tracemalloc.start()
+        try:
+            for _ in range(min(MEMORY_SAMPLES, requests)):
+                env = build()
+                tracemalloc.reset_peak()
+                response = handler(env, lambda status, headers: None)
+                b''.join(response)
+                response.close()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'rps': rate,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'queries': sum(count for _, count in outcomes) / requests,
+            'peak_kb': peak / 1024,
+            'statuses': {str(code): codes.count(code) for code in sorted(set(codes))},
+        }
+
+    def compare(self, previous, results):
+        self.stdout.write(f"Compared with the run of {previous.get('created_at')}:")
+        self.stdout.write(f"{'endpoint':<34}{'req/s':>10}{'p95 ms':>10}{'queries':>10}{'peak KB':>10}")
+        for key, result in results['endpoints'].items():
+            before = previous.get('endpoints', {}).get(key)
+            if not before:
+                continue
+            change = lambda field: (result[field] - before[field]) / before[field] * 100 if before[field] else 0
+            self.stdout.write(
+                f"{key:<34}{change('rps'):>+9.0f}%{change('p95_ms'):>+9.0f}%"
+                f"{result['queries'] - before['queries']:>+10.1f}{change('peak_kb'):>+9.0f}%"
+            )
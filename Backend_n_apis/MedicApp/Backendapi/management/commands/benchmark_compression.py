@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from Backendapi.management.commands.benchmark_renderers import best_of, patient_payload
+from Backendapi.middleware import _Brotli, _Gzip, _Zstd, brotli, zstandard
+from Backendapi.renderers import ORJSONRenderer
+
+
+def compress(compressor_class, level, body):
+    compressor = compressor_class(level)
+    return compressor.compress(body) + compressor.finish()
+
+
+class Command(BaseCommand):
+    help = 'Compare CPU time and response size for each compression algorithm and level'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        body = ORJSONRenderer().render(patient_payload(options['patients']))
+        repeat = options['repeat']
+
+        candidates = [('gzip', _Gzip, level) for level in (1, 6, 9)]
+        if brotli is not None:
+            candidates += [('br', _Brotli, level) for level in (1, 4, 6, 9)]
+        if zstandard is not None:
+            candidates += [('zstd', _Zstd, level) for level in (1, 3, 9, 12)]
+
+        self.stdout.write(f"{options['patients']} patients, {len(body)} bytes of JSON, best of {repeat}")
+        self.stdout.write(f"{'encoding':<12}{'level':>6}{'ms':>10}{'bytes':>12}{'ratio':>8}")
+        for name, compressor_class, level in candidates:
+            size = len(compress(compressor_class, level, body))
+            ms = best_of(repeat, lambda: compress(compressor_class, level, body))
+            self.stdout.write(f"{name:<12}{level:>6}{ms:>10.1f}{size:>12}{len(body) / size:>8.1f}")
@@ -0,0 +1,79 @@
+import time
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from Backendapi.management.commands.benchmark_login import percentile, run_concurrently
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec and tail latency with a new database connection per request '
+            'against persistent connections and the configured settings (e.g. DB_POOL)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', default='1,4,8',
+                            help='Comma separated numbers of concurrent requests to try')
+        parser.add_argument('--path', default='/backendapi/patient/search/?q=12',
+                            help='A public endpoint that queries the database')
+        parser.add_argument('--connect-delay', type=float, default=0,
+                            help='Milliseconds added to every new connection, to stand in for '
+                                 'the TCP/TLS handshake of a remote Postgres')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        path = options['path']
+        delay = options['connect_delay'] / 1000
+        opened = []
+
+        def on_connect(sender, connection, **kwargs):
+            opened.append(connection.alias)
+            if delay:
+                time.sleep(delay)
+
+        # The real WSGI handler rather than the test client, which turns off
+        # the per-request connection cleanup being measured here
+        handler = WSGIHandler()
+        url = urlsplit(path)
+
+        def request():
+            environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path, 'QUERY_STRING': url.query}
+            setup_testing_defaults(environ)
+            statuses = []
+            response = handler(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            response.close()
+            return int(statuses[0].split()[0])
+
+        database = connections['default'].settings_dict
+        configured = database['CONN_MAX_AGE']
+        if database.get('OPTIONS', {}).get('pool'):
+            # A pool can't be combined with CONN_MAX_AGE; run again without
+            # DB_POOL for the other rows
+            modes = [('pool', 0)]
+        else:
+            modes = [('per request', 0), ('persistent', 60)]
+
+        connection_created.connect(on_connect)
+        try:
+            self.stdout.write(f"{options['requests']} requests to {path} per run")
+            self.stdout.write(
+                f"{'connections':<14}{'threads':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'opened':>8}  statuses"
+            )
+            for name, max_age in modes:
+                database['CONN_MAX_AGE'] = max_age
+                for concurrency in levels:
+                    connections.close_all()
+                    opened.clear()
+                    rate, latencies, statuses = run_concurrently(request, options['requests'], concurrency)
+                    counts = ', '.join(f'{code}: {statuses.count(code)}' for code in sorted(set(statuses)))
+                    self.stdout.write(
+                        f"{name:<14}{concurrency:>8}{rate:>10.1f}{percentile(latencies, 50):>10.1f}"
+                        f"{percentile(latencies, 99):>10.1f}{len(opened):>8}  {counts}"
+                    )
+        finally:
+            connection_created.disconnect(on_connect)
+            database['CONN_MAX_AGE'] = configured
@@ -0,0 +1,81 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run_concurrently(func, requests, concurrency):
+    """Call `func` `requests` times from `concurrency` threads -> (per second, latencies in ms, results)"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        outcomes = list(pool.map(lambda _: timed(func), range(requests)))
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, [ms for ms, _ in outcomes], [result for _, result in outcomes]
+
+
+def percentile(latencies, pct):
+    return statistics.quantiles(latencies, n=100, method='inclusive')[pct - 1]
+
+
+def post_login(url, employee_id, password):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({'employee_id': employee_id, 'password': password}).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+class Command(BaseCommand):
+    help = ('Measure login throughput and tail latency under concurrency, either for each '
+            'configured password hasher or against a running server with --url')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', default='1,4,8',
+                            help='Comma separated numbers of concurrent logins to try')
+        parser.add_argument('--url', help='Login endpoint of a running server, e.g. '
+                                          'http://localhost:8000/backendapi/login/')
+        parser.add_argument('--employee-id', default='benchmark')
+        parser.add_argument('--password', default='benchmark-password')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        password = options['password']
+
+        if options['url']:
+            # Throttled (429) answers are reported separately: they skip hashing
+            # and would otherwise flatter the numbers
+            candidates = [('http', lambda: post_login(options['url'], options['employee_id'], password))]
+        else:
+            # Hashing releases the GIL, so threads behave like separate workers here
+            candidates = []
+            for hasher in get_hashers():
+                encoded = hasher.encode(password, hasher.salt())
+                candidates.append((hasher.algorithm, lambda hasher=hasher, encoded=encoded: hasher.verify(password, encoded)))
+
+        self.stdout.write(f"{options['requests']} logins per run")
+        self.stdout.write(f"{'login':<16}{'threads':>8}{'per sec':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  results")
+        for name, func in candidates:
+            for concurrency in levels:
+                rate, latencies, results = run_concurrently(func, options['requests'], concurrency)
+                counts = ', '.join(f'{result}: {results.count(result)}' for result in sorted(set(results), key=str))
+                self.stdout.write(
+                    f"{name:<16}{concurrency:>8}{rate:>10.1f}{percentile(latencies, 50):>10.1f}"
+                    f"{percentile(latencies, 95):>10.1f}{percentile(latencies, 99):>10.1f}  {counts}"
+                )
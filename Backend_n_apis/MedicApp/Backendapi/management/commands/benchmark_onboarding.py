@@ -0,0 +1,65 @@
+import os
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.crypto import get_random_string
+from Backend.hashers import HASH_WORKERS, make_passwords
+from Backend.models import Doctor
+from Backend.onboarding import DoctorOnboarder, credentials_email
+from Backend.outbox import enqueue_mail
+
+
+def roster(count, prefix):
+    return [
+        {'employee_id': f'{prefix}{i:05d}', 'email': f'{prefix.lower()}{i}@example.com',
+         'firstName': 'Bench', 'lastName': f'Doctor {i}', 'specialization': 'Cardiology'}
+        for i in range(count)
+    ]
+
+
+def one_at_a_time(rows):
+    """What registerdr does per doctor, for every row"""
+    for row in rows:
+        password = get_random_string(12)
+        user = User.objects.create(
+            username=row['employee_id'], email=row['email'], first_name=row['firstName'],
+            last_name=row['lastName'], password=make_password(password), is_active=True,
+        )
+        Doctor.objects.create(user=user, employee_id=row['employee_id'],
+                              specialization=row['specialization'], is_active=True)
+        enqueue_mail(*credentials_email(row['firstName'], row['employee_id'], password), [row['email']])
+
+
+class Command(BaseCommand):
+    help = ('Compare doctors onboarded per second one at a time (as registerdr does) with the bulk '
+            'onboarder at different numbers of hashing processes. Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=200)
+        parser.add_argument('--workers', default=f'1,{HASH_WORKERS}',
+                            help='Comma separated numbers of hashing processes to try')
+
+    def handle(self, *args, **options):
+        count = options['doctors']
+        levels = sorted({int(level) for level in options['workers'].split(',')})
+        self.stdout.write(f"{count} doctors per run, {os.cpu_count()} CPUs")
+        # Start the pool up front, so spawning its processes isn't timed
+        make_passwords(['warm-up'] * max(levels) * 2, max(levels))
+
+        runs = [('one at a time', lambda rows: one_at_a_time(rows))]
+        runs += [
+            (f'bulk, {workers} proc', lambda rows, workers=workers: DoctorOnboarder(workers=workers).run(rows))
+            for workers in levels
+        ]
+        with transaction.atomic():
+            for name, func in runs:
+                rows = roster(count, f'B{uuid.uuid4().hex[:6].upper()}')
+                start = time.perf_counter()
+                func(rows)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{name:<16}{count / elapsed:>10.1f} doctors/s{elapsed:>10.2f}s")
+            transaction.set_rollback(True)
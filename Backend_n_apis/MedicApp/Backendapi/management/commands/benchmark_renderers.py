@@ -0,0 +1,61 @@
+import io
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from Backendapi.parsers import MessagePackParser, ORJSONParser
+from Backendapi.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+
+
+def patient_payload(count):
+    """A patient list response shaped like backendapi/patient/?all=true"""
+    now = datetime.now(timezone.utc).isoformat()
+    categories = [
+        {'id': pk, 'name': f'Program {pk}', 'description': 'Program description ' * 5,
+         'created_at': now, 'updated_at': now}
+        for pk in range(1, 6)
+    ]
+    return {'patients': [
+        {'id': i, 'PatID': 100000 + i, 'FName': f'First{i}', 'MName': 'Middle', 'SName': f'Surname{i}',
+         'Age': 42.0, 'DOB': '1984-03-01', 'city': 'Nairobi',
+         'categories': categories[:i % 3], 'created_at': now}
+        for i in range(count)
+    ]}
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF\'s JSON renderer/parser with the orjson and MessagePack ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        data = patient_payload(options['patients'])
+        repeat = options['repeat']
+
+        candidates = [
+            ('DRF JSONRenderer', JSONRenderer(), JSONParser(), 'application/json'),
+            ('ORJSONRenderer', ORJSONRenderer(), ORJSONParser(), 'application/json'),
+        ]
+        if msgpack is not None:
+            candidates.append(('MessagePackRenderer', MessagePackRenderer(), MessagePackParser(), 'application/msgpack'))
+
+        self.stdout.write(f"{options['patients']} patients, best of {repeat}")
+        self.stdout.write(f"{'renderer':<22}{'render ms':>12}{'parse ms':>12}{'bytes':>12}")
+        for name, renderer, parser, media_type in candidates:
+            body = renderer.render(data, media_type)
+            render_ms = best_of(repeat, lambda: renderer.render(data, media_type))
+            parse_ms = best_of(repeat, lambda: parser.parse(io.BytesIO(body), media_type, {}))
+            self.stdout.write(f"{name:<22}{render_ms:>12.1f}{parse_ms:>12.1f}{len(body):>12}")
@@ -0,0 +1,87 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from Backendapi.revocation import registry
+from Backendapi.tokens import RevocableRefreshToken, RoleTokenRefreshSerializer
+
+BATCH_SIZE = 10000
+
+
+def seed_blacklist(user, count):
+    """`count` outstanding, blacklisted and not yet expired tokens for `user`"""
+    expires_at = timezone.now() + timedelta(days=30)
+    for start in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - start)
+        jtis = [uuid.uuid4().hex for _ in range(size)]
+        OutstandingToken.objects.bulk_create([
+            OutstandingToken(user=user, jti=jti, token='', expires_at=expires_at) for jti in jtis
+        ])
+        ids = OutstandingToken.objects.filter(jti__in=jtis).values_list('id', flat=True)
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token_id=pk) for pk in ids])
+
+
+def refresh_rate(serializer_class, token, count):
+    """Refreshes per second, following the rotation chain from `token`"""
+    start = time.perf_counter()
+    for _ in range(count):
+        serializer = serializer_class(data={'refresh': token})
+        serializer.is_valid(raise_exception=True)
+        token = serializer.validated_data['refresh']
+    return count / (time.perf_counter() - start)
+
+
+def check_rate(check, tokens):
+    start = time.perf_counter()
+    for token in tokens:
+        check(token)
+    return len(tokens) / (time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    help = ('Measure refresh throughput against a large token blacklist. Everything is '
+            'created inside a transaction that is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=200000,
+                            help='Blacklisted tokens to seed before measuring')
+        parser.add_argument('--refreshes', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(username=f'benchmark-{uuid.uuid4().hex[:8]}')
+
+            start = time.perf_counter()
+            seed_blacklist(user, options['tokens'])
+            self.stdout.write(f"Seeded {options['tokens']} blacklisted tokens in {time.perf_counter() - start:.1f}s")
+
+            start = time.perf_counter()
+            registry.reload()
+            bloom = registry._bloom
+            self.stdout.write(
+                f"Bloom filter: {len(bloom.bits) / 1024 / 1024:.1f} MB, {bloom.hashes} hashes, "
+                f"built in {time.perf_counter() - start:.1f}s"
+            )
+
+            fresh = [RefreshToken.for_user(user) for _ in range(options['refreshes'])]
+            db_check = lambda token: BlacklistedToken.objects.filter(token__jti=token['jti']).exists()
+            self.stdout.write(f"{'blacklist check':<28}{'per second':>12}")
+            self.stdout.write(f"{'database query':<28}{check_rate(db_check, fresh):>12.0f}")
+            self.stdout.write(f"{'revocation registry':<28}{check_rate(registry.is_revoked, fresh):>12.0f}")
+
+            count = options['refreshes']
+            stock = refresh_rate(TokenRefreshSerializer, str(RefreshToken.for_user(user)), count)
+            ours = refresh_rate(RoleTokenRefreshSerializer, str(RevocableRefreshToken.for_user(user)), count)
+            self.stdout.write(f"{'token refresh':<28}{'per second':>12}")
+            self.stdout.write(f"{'TokenRefreshSerializer':<28}{stock:>12.0f}")
+            self.stdout.write(f"{'RoleTokenRefreshSerializer':<28}{ours:>12.0f}")
+
+            transaction.set_rollback(True)
+        registry.reload()
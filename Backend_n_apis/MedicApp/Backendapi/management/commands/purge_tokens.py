@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Backendapi.revocation import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding/blacklisted tokens and stale revocation cutoffs in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and purge every --interval seconds')
+        parser.add_argument('--interval', type=float, default=3600.0)
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = purge_expired(options['batch_size'])
+            self.stdout.write(f"Purged {deleted} expired tokens")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
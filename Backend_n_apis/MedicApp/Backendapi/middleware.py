@@ -0,0 +1,308 @@
+import logging
+import random
+import re
+import time
+import zlib
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Only these content types are worth compressing; images, archives and
+# anything already carrying a Content-Encoding are left alone.
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/x-ndjson',
+    'application/msgpack',
+    'application/javascript',
+    'application/xml',
+)
+
+# Streaming responses are flushed once this much input has been buffered,
+# so NDJSON/CSV exports keep trickling out instead of waiting for the end.
+STREAM_FLUSH_SIZE = 32 * 1024
+
+_accept_encoding_re = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?')
+
+# Quoted strings and numbers, and IN (...) lists of any length, so
+# statements differing only in their values count as the same one
+_sql_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_sql_in_list_re = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+logger = logging.getLogger(__name__)
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _Zstd:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_encodings():
+    """Supported encodings, in the order the server prefers them"""
+    encodings = {
+        'br': (_Brotli, getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4)) if brotli else None,
+        'zstd': (_Zstd, getattr(settings, 'COMPRESSION_ZSTD_LEVEL', 3)) if zstandard else None,
+        'gzip': (_Gzip, getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)),
+    }
+    order = getattr(settings, 'COMPRESSION_ENCODINGS', ('br', 'zstd', 'gzip'))
+    return [(name, *encodings[name]) for name in order if encodings.get(name)]
+
+
+def negotiate_encoding(accept_encoding, encodings):
+    """
+    Pick the best encoding the client accepts (q > 0), preferring the
+    client's q-values and then the server's order.
+    """
+    accepted = {}
+    for match in _accept_encoding_re.finditer(accept_encoding):
+        try:
+            accepted[match.group(1).lower()] = float(match.group(2) or 1)
+        except ValueError:
+            continue
+
+    best = None
+    for name, compressor, level in encodings:
+        q = accepted.get(name, accepted.get('*', 0))
+        if q > 0 and (best is None or q > best[0]):
+            best = (q, name, compressor, level)
+    return best[1:] if best else None
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses with brotli, zstd or gzip according to the
+    request's Accept-Encoding. Bodies under COMPRESSION_MIN_SIZE bytes,
+    non-text content and responses that are already encoded are passed
+    through untouched; streaming responses are compressed on the fly.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.encodings = available_encodings()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code == 304:
+            return response
+        content_type = response.get('Content-Type', '').lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        chosen = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if chosen is None:
+            return response
+        name, compressor_class, level = chosen
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._compress_async(compressor_class(level), response.streaming_content)
+            else:
+                response.streaming_content = self._compress_stream(compressor_class(level), response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressor = compressor_class(level)
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The body bytes changed, so a strong ETag no longer holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = name
+        return response
+
+    @staticmethod
+    def _compress_stream(compressor, chunks):
+        pending = 0
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_SIZE:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def _compress_async(compressor, chunks):
+        pending = 0
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_SIZE:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+def normalize_sql(sql):
+    sql = _sql_literal_re.sub('?', sql)
+    sql = _sql_in_list_re.sub('(...)', sql)
+    return ' '.join(sql.split())
+
+
+class _RequestQueries:
+    """Statements run while handling one request, fed by connection.execute_wrapper()."""
+
+    def __init__(self):
+        self.statements = Counter()
+        self.count = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.count += 1
+            self.statements[normalize_sql(sql)] += 1
+
+    def repeated(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Opt-in (QUERY_INSTRUMENTATION) timing of a sample of requests: query
+    count, database time and rendering time go out as a Server-Timing
+    header and a log record, and statements repeated at least
+    QUERY_N_PLUS_ONE_THRESHOLD times in one request are logged as probable
+    N+1 queries. When switched off Django drops the middleware entirely.
+
+    Rendering time only covers responses rendered after the view returns,
+    i.e. DRF Responses and other TemplateResponses; views that build their
+    body themselves (plain HttpResponse, StreamingHttpResponse) report 0
+    and their serialization counts towards `total` alone.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_INSTRUMENTATION_SAMPLE_RATE', 1.0)
+        self.threshold = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        queries = request._instrumented_queries = _RequestQueries()
+        start = time.perf_counter()
+        wrappers = [connection.execute_wrapper(queries) for connection in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            response = self.get_response(request)
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        total = time.perf_counter() - start
+
+        repeated = queries.repeated(self.threshold)
+        timings = [
+            f'db;dur={queries.db_time * 1000:.1f};desc="{queries.count} queries"',
+            f'render;dur={queries.render_time * 1000:.1f};desc="response rendering"',
+            f'total;dur={total * 1000:.1f}',
+        ]
+        if repeated:
+            timings.append(f'n1;desc="{len(repeated)} repeated statements"')
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': queries.count,
+            'db_ms': round(queries.db_time * 1000, 1),
+            'render_ms': round(queries.render_time * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+        }
+        logger.info(' '.join(f'{key}={value}' for key, value in fields.items()), extra=fields)
+        for sql, count in repeated:
+            logger.warning(
+                'Probable N+1: %s %s ran %d times: %s', request.method, request.path, count, sql,
+                extra={**fields, 'repeated': count, 'sql': sql},
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF renders its Response after the view returns; time that, less
+        # any lazy queries it triggers, which already count as db time
+        queries = getattr(request, '_instrumented_queries', None)
+        if queries is not None:
+            render = response.render
+
+            def timed_render():
+                start, db_time = time.perf_counter(), queries.db_time
+                try:
+                    return render()
+                finally:
+                    queries.render_time += time.perf_counter() - start - (queries.db_time - db_time)
+
+            response.render = timed_render
+        return response
@@ -0,0 +1,59 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PatientCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the patient list.
+
+    Ordered on the unique PatID rather than created_at, which is auto_now and
+    would move rows between pages every time a patient is edited. Every page
+    is a `PatID > cursor` range scan, so page 5,000 costs the same as page 1.
+    """
+    ordering = 'PatID'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'patients': data,
+        })
+
+
+class PatientSearchPagination(LimitOffsetPagination):
+    """
+    Limit/offset pages for ranked search results.
+
+    Ranked matches have no stable key to seek on, so instead of running a
+    COUNT(*) over every match one extra row is fetched to tell whether a
+    next page exists.
+    """
+    default_limit = 25
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'patients': data,
+        })
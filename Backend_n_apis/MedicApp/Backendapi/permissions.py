@@ -0,0 +1,28 @@
+import os
+
+from rest_framework.permissions import BasePermission
+from .tokens import SYSTEM_ADMIN
+
+
+def token_claims(request):
+    """
+    Role claims from the request's access token. Tokens issued before the
+    claims existed only carry user_id, so their role is worked out from
+    the (already authenticated) user instead.
+    """
+    token = request.auth
+    if token is None:
+        return {}
+    if 'role' in token:
+        return token
+    is_admin = request.user.username == os.environ.get('AdminCreds')
+    return {'role': SYSTEM_ADMIN if is_admin else None, 'is_active': request.user.is_active}
+
+
+class IsSystemAdmin(BasePermission):
+    """Only the system admin account (AdminCreds)."""
+    message = "Not authorized"
+
+    def has_permission(self, request, view):
+        return token_claims(request).get('role') == SYSTEM_ADMIN
+
@@ -0,0 +1,255 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.connection import ConnectionProxy
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from Backend.models import TokenRevocation
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_VERSION_KEY = 'revocations:version'
+# The version tells every worker that another one revoked something, so it
+# goes to the cache they all share (see throttle_cache in .throttling); in
+# the per-process default cache nobody else would ever see it change
+shared_cache = ConnectionProxy(caches, 'throttle')
+SYNC_INTERVAL = getattr(settings, 'REVOCATION_SYNC_INTERVAL', 5)
+REBUILD_INTERVAL = getattr(settings, 'REVOCATION_REBUILD_INTERVAL', 3600)
+BLOOM_CAPACITY = getattr(settings, 'REVOCATION_BLOOM_CAPACITY', 1_000_000)
+BLOOM_ERROR_RATE = getattr(settings, 'REVOCATION_BLOOM_ERROR_RATE', 0.001)
+# Incremental syncs re-read this many blacklist ids below the last one seen,
+# so rows whose transaction committed out of id order aren't skipped.
+SYNC_OVERLAP = 100
+
+
+class BloomFilter:
+    """
+    Fixed size set membership test with no false negatives and a false
+    positive rate of about `error_rate` while it holds up to `capacity` keys.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key, count=True):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += count
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationRegistry:
+    """
+    Per-process view of the revoked tokens. A bloom filter over the
+    blacklisted jtis answers "not revoked" for almost every token without
+    touching the database; only filter hits are confirmed against the
+    blacklist table. Per-user "revoked before" cutoffs are few enough to
+    keep in a dict.
+
+    Building the filter scans the whole blacklist, so it happens on a
+    background thread: until the first one is ready every token is checked
+    against the table, and later rebuilds keep the current filter in
+    service until they are swapped in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._cutoffs = {}
+        self._last_id = 0
+        self._version = None
+        self._synced_at = None
+        self._built_at = None
+        self._building = False
+
+    def _build(self):
+        """A filter of the unexpired blacklisted jtis, and the highest blacklist id in it."""
+        now = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=now).values_list('id', 'token__jti')
+        count = rows.count()
+        bloom = BloomFilter(max(BLOOM_CAPACITY, 2 * count), BLOOM_ERROR_RATE)
+        last_id = 0
+        for pk, jti in rows.iterator(chunk_size=10000):
+            bloom.add(jti)
+            last_id = max(last_id, pk)
+        return bloom, last_id
+
+    def _add_since(self, bloom, last_id):
+        """Add the jtis blacklisted after `last_id` to `bloom`; returns the new last id."""
+        rows = BlacklistedToken.objects.filter(id__gt=last_id - SYNC_OVERLAP).values_list('id', 'token__jti')
+        for pk, jti in rows:
+            if pk > last_id:
+                bloom.add(jti)
+                last_id = pk
+            else:
+                # Already counted, but may have been missed the first time
+                bloom.add(jti, count=False)
+        return last_id
+
+    def _swap(self, bloom, last_id):
+        with self._lock:
+            # Catch up with what was blacklisted while it was being built
+            self._last_id = self._add_since(bloom, last_id)
+            self._bloom = bloom
+            self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        try:
+            self._swap(*self._build())
+        except Exception:
+            logger.exception("Rebuilding the revocation filter failed")
+        finally:
+            self._building = False
+            connection.close()
+
+    def _start_rebuild(self):
+        # Called with self._lock held
+        if not self._building:
+            self._building = True
+            threading.Thread(target=self._rebuild_in_background, name='revocation-rebuild', daemon=True).start()
+
+    def _sync(self):
+        version = shared_cache.get(REVOCATION_VERSION_KEY)
+        with self._lock:
+            if self._bloom is None or time.monotonic() - self._built_at > REBUILD_INTERVAL:
+                self._start_rebuild()
+            if self._bloom is not None:
+                self._last_id = self._add_since(self._bloom, self._last_id)
+                if self._bloom.count > 2 * BLOOM_CAPACITY:
+                    # Still correct while the new one is built, just with more false positives
+                    self._start_rebuild()
+            self._cutoffs = {
+                user_id: revoked_before.timestamp()
+                for user_id, revoked_before in TokenRevocation.objects.values_list('user_id', 'revoked_before')
+            }
+            self._version = version
+            self._synced_at = time.monotonic()
+
+    def _maybe_sync(self):
+        if (
+            self._synced_at is None
+            or time.monotonic() - self._synced_at > SYNC_INTERVAL
+            or shared_cache.get(REVOCATION_VERSION_KEY) != self._version
+        ):
+            self._sync()
+
+    def reload(self):
+        """Rebuild the filter from the database now, in this thread."""
+        self._swap(*self._build())
+        self._sync()
+
+    def is_revoked(self, token):
+        self._maybe_sync()
+        cutoff = self._cutoffs.get(token.get(api_settings.USER_ID_CLAIM))
+        # iat has whole second precision: a token is revoked if the second it
+        # was issued in began before the cutoff, which also rejects those
+        # issued later in that same second
+        if cutoff is not None and token.get('iat', 0) < cutoff:
+            return True
+        jti = token[api_settings.JTI_CLAIM]
+        bloom = self._bloom
+        if bloom is not None and jti not in bloom:
+            return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def revoked(self, jtis=(), cutoffs=None):
+        """Record revocations made by this process and tell the others."""
+        with self._lock:
+            if self._bloom is not None:
+                for jti in jtis:
+                    self._bloom.add(jti)
+            self._cutoffs.update(cutoffs or {})
+            previous = shared_cache.get(REVOCATION_VERSION_KEY)
+            version = time.time_ns()
+            shared_cache.set(REVOCATION_VERSION_KEY, version, timeout=None)
+            # This process already has the change, so unless it was behind
+            # anyway there is nothing to sync for it
+            if previous == self._version:
+                self._version = version
+
+
+registry = RevocationRegistry()
+
+
+def is_revoked(token):
+    return registry.is_revoked(token)
+
+
+def blacklist_token(token):
+    """
+    Blacklist any simplejwt token, access or refresh, and return its
+    OutstandingToken. Blacklisting a token twice is harmless.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    with transaction.atomic():
+        outstanding, _ = OutstandingToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                'user_id': token.get(api_settings.USER_ID_CLAIM),
+                'token': str(token),
+                'expires_at': datetime_from_epoch(token['exp']),
+            },
+        )
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=outstanding)], ignore_conflicts=True)
+    registry.revoked(jtis=[jti])
+    return outstanding
+
+
+def revoke_all(user):
+    """
+    Reject every token issued to `user` so far: the outstanding refresh
+    tokens are blacklisted in bulk and a cutoff covers the rest.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        TokenRevocation.objects.update_or_create(user=user, defaults={'revoked_before': now})
+        outstanding = list(
+            OutstandingToken.objects.filter(user=user, expires_at__gt=now, blacklistedtoken__isnull=True)
+            .values_list('id', 'jti')
+        )
+        BlacklistedToken.objects.bulk_create(
+            [BlacklistedToken(token_id=pk) for pk, _ in outstanding], ignore_conflicts=True
+        )
+    registry.revoked(jtis=[jti for _, jti in outstanding], cutoffs={user.pk: now.timestamp()})
+    return len(outstanding)
+
+
+def purge_expired(batch_size=5000):
+    """
+    Delete expired outstanding tokens with their blacklist rows, and cutoffs
+    older than any token they could still apply to, `batch_size` rows per
+    statement so the tables are never locked for long.
+    Returns the number of tokens deleted.
+    """
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        OutstandingToken.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+    longest = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    TokenRevocation.objects.filter(revoked_before__lte=now - longest).delete()
+    return deleted
@@ -1,3 +1,528 @@
-from django.test import TestCase
+import os
+import time
+import zlib
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.throttling import SimpleRateThrottle
+from Backend.cache import AUTH_USER_RECHECK_INTERVAL
+from Backend.models import Category, Doctor, Patient
+from Backend.onboarding import MAX_ROWS_PER_REQUEST
+from .middleware import STREAM_FLUSH_SIZE, CompressionMiddleware, QueryInstrumentationMiddleware, brotli, zstandard
+from .revocation import (
+    REVOCATION_VERSION_KEY, BloomFilter, RevocationRegistry, blacklist_token, registry, revoke_all,
+)
+from .tokens import tokens_for_user
+
+
+def make_patients(patids, **fields):
+    return Patient.objects.bulk_create([
+        Patient(PatID=patid, **{'FName': 'First', 'MName': 'Middle', 'SName': 'Surname', 'Age': 30,
+                                'DOB': date(1994, 1, 1), 'city': 'Nairobi', **fields})
+        for patid in patids
+    ])
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            Patient.objects.create(PatID=300000 + i, FName='First', MName='Middle', SName='Surname',
+                                   Age=30, DOB=date(1994, 1, 1), city='Nairobi')
+
+    def test_unchanged_resource_is_not_modified(self):
+        url = reverse('patient')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_validators_do_not_depend_on_the_process_cache(self):
+        url = reverse('patient')
+        first = self.client.get(url)
+        # As another worker would see it: nothing in its cache yet
+        cache.clear()
+        second = self.client.get(url)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(first['Last-Modified'], second['Last-Modified'])
+
+    def test_deleting_a_category_changes_the_etag(self):
+        category = Category.objects.create(name='Diabetes')
+        patient = Patient.objects.get(PatID=300001)
+        patient.categories.add(category)
+        urls = [reverse('patient'), reverse('patient-detail', kwargs={'patient_id': patient.PatID})]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+
+        category.delete()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_renaming_a_category_changes_the_etag(self):
+        category = Category.objects.create(name='Diabetes')
+        url = reverse('patient-detail', kwargs={'patient_id': 300001})
+        etag = self.client.get(url)['ETag']
+        category.name = 'Type 2 diabetes'
+        category.save()
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_query_variants_have_their_own_etag(self):
+        url = reverse('patient')
+        first = self.client.get(url)
+        other = self.client.get(url, {'fields': 'PatID'})
+        self.assertNotEqual(first['ETag'], other['ETag'])
+        response = self.client.get(url, {'fields': 'PatID'}, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', response['Vary'])
+
+
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        registry.reload()
+        self.user = User.objects.create_user('DR001', password='password')
+        self.headers = {'Authorization': f'Bearer {tokens_for_user(self.user).access_token}'}
+
+    def get(self):
+        return self.client.get(reverse('doctor-stats'), headers=self.headers).status_code
+
+    def test_deactivation_elsewhere_applies_after_the_recheck_interval(self):
+        self.assertEqual(self.get(), 200)
+        # As another worker would: no signal reaches this process's cache
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get(), 200)
+        later = time.time() + AUTH_USER_RECHECK_INTERVAL + 1
+        with mock.patch('Backendapi.authentication.time.time', return_value=later):
+            self.assertEqual(self.get(), 401)
+
+    def test_deactivation_in_this_process_applies_immediately(self):
+        self.assertEqual(self.get(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(), 401)
+
+
+class BloomFilterTests(TestCase):
+
+    def test_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class RevocationTests(TestCase):
+
+    def setUp(self):
+        registry.reload()
+        self.user = User.objects.create_user('DR002', password='password')
+
+    def get(self, token):
+        headers = {'Authorization': f'Bearer {token}'}
+        return self.client.get(reverse('doctor-stats'), headers=headers).status_code
+
+    def test_token_is_accepted_until_blacklisted(self):
+        access = tokens_for_user(self.user).access_token
+        self.assertEqual(self.get(access), 200)
+        blacklist_token(access)
+        self.assertEqual(self.get(access), 401)
+
+    def test_logout_rejects_the_token_used(self):
+        access = tokens_for_user(self.user).access_token
+        other = tokens_for_user(self.user).access_token
+        response = self.client.post(reverse('logout'), content_type='application/json', headers={'Authorization': f'Bearer {access}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(access), 401)
+        self.assertEqual(self.get(other), 200)
+
+    def test_logout_all_rejects_older_tokens(self):
+        refresh = tokens_for_user(self.user)
+        access = refresh.access_token
+        response = self.client.post(reverse('logout-all'), content_type='application/json', headers={'Authorization': f'Bearer {access}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(access), 401)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_from_the_same_second_as_logout_all_is_rejected(self):
+        access = tokens_for_user(self.user).access_token
+        revoke_all(self.user)
+        self.assertEqual(self.get(access), 401)
+
+    def test_login_after_logout_all_is_accepted(self):
+        # Logged out everywhere a couple of seconds ago
+        earlier = timezone.now() - timedelta(seconds=2)
+        with mock.patch('Backendapi.revocation.timezone.now', return_value=earlier):
+            revoke_all(self.user)
+        self.assertEqual(self.get(tokens_for_user(self.user).access_token), 200)
+
+    def test_revocation_by_another_process_is_synced(self):
+        other = RevocationRegistry()
+        other.reload()
+        access = tokens_for_user(self.user).access_token
+        self.assertFalse(other.is_revoked(access))
+
+        # Another worker reads the version through its own cache backend,
+        # which shares nothing in memory with this process's one
+        throttle = settings.CACHES['throttle']
+        other_process_cache = FileBasedCache(throttle['LOCATION'], throttle.get('OPTIONS', {}))
+        version = other_process_cache.get(REVOCATION_VERSION_KEY)
+        blacklist_token(access)
+        self.assertNotEqual(other_process_cache.get(REVOCATION_VERSION_KEY), version)
+        # so `other` syncs on its next check rather than after REVOCATION_SYNC_INTERVAL
+        with mock.patch('Backendapi.revocation.shared_cache', other_process_cache):
+            self.assertTrue(other.is_revoked(access))
+
+    def test_tokens_are_checked_against_the_table_until_the_filter_is_built(self):
+        fresh = RevocationRegistry()
+        access = tokens_for_user(self.user).access_token
+        blacklist_token(access)
+        with mock.patch.object(fresh, '_start_rebuild') as start_rebuild:
+            self.assertTrue(fresh.is_revoked(access))
+            self.assertFalse(fresh.is_revoked(tokens_for_user(self.user).access_token))
+        start_rebuild.assert_called()
+        self.assertIsNone(fresh._bloom)
+
+
+class DoctorBatchLimitTests(TestCase):
+
+    def setUp(self):
+        registry.reload()
+        environ = mock.patch.dict(os.environ, {'AdminCreds': 'ADMIN'})
+        environ.start()
+        self.addCleanup(environ.stop)
+        admin = User.objects.create_user('ADMIN', password='password')
+        self.headers = {'Authorization': f'Bearer {tokens_for_user(admin).access_token}'}
+
+    def onboard(self, count, **data):
+        doctors = [{'employee_id': f'ONB{i}', 'email': f'onb{i}@example.com', 'firstName': 'Amina',
+                    'lastName': 'Otieno'} for i in range(count)]
+        return self.client.post(reverse('doctors-onboard'), {'doctors': doctors, **data},
+                                content_type='application/json', headers=self.headers)
+
+    def test_verified_roster_over_the_limit_is_rejected(self):
+        response = self.onboard(MAX_ROWS_PER_REQUEST + 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Doctor.objects.exists())
+
+    def test_pending_roster_needs_no_hashing_and_is_not_capped(self):
+        response = self.onboard(MAX_ROWS_PER_REQUEST + 1, verified=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], MAX_ROWS_PER_REQUEST + 1)
+
+    def test_verify_all_pending_is_capped_and_reports_the_rest(self):
+        self.onboard(MAX_ROWS_PER_REQUEST + 2, verified=False)
+        with mock.patch('Backend.onboarding.make_passwords', side_effect=lambda passwords, workers: passwords):
+            response = self.client.post(reverse('verify-doctors'), {'all_pending': True},
+                                        content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['counts'], {'verified': MAX_ROWS_PER_REQUEST})
+        self.assertEqual(response.json()['remaining'], 2)
+
+    def test_verify_too_many_ids_is_rejected(self):
+        employee_ids = [f'ONB{i}' for i in range(MAX_ROWS_PER_REQUEST + 1)]
+        response = self.client.post(reverse('verify-doctors'), {'employee_ids': employee_ids},
+                                    content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class PatientListTests(TestCase):
+
+    def get(self, url=None, **params):
+        response = self.client.get(url or reverse('patient'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def patids(self, page):
+        return [patient['PatID'] for patient in page['patients']]
+
+    def test_cursor_pages_are_stable_across_inserts(self):
+        make_patients(range(1000, 1100, 2))
+        first = self.get(page_size=20)
+        self.assertEqual(self.patids(first), list(range(1000, 1040, 2)))
+        self.assertIsNone(first['previous'])
+
+        # New patients before and inside the next page don't shift it
+        make_patients([1, 1039, 1041])
+        second = self.get(first['next'])
+        self.assertEqual(self.patids(second), [1039, 1040, 1041] + list(range(1042, 1076, 2)))
+        self.assertEqual(self.patids(self.get(first['next'])), self.patids(second))
+
+        previous = self.get(second['previous'])
+        self.assertEqual(self.patids(previous), list(range(1000, 1040, 2)))
+
+    def test_page_size_is_capped(self):
+        make_patients(range(1, 602))
+        self.assertEqual(len(self.get()['patients']), 50)
+        self.assertEqual(len(self.get(page_size=5000)['patients']), 500)
+
+    def test_all_returns_the_legacy_shape(self):
+        make_patients(range(1, 61))
+        data = self.get(all='true')
+        self.assertEqual(list(data), ['patients'])
+        self.assertEqual(self.patids(data), list(range(1, 61)))
+        self.assertEqual(
+            set(data['patients'][0]),
+            {'id', 'PatID', 'FName', 'MName', 'SName', 'Age', 'DOB', 'city', 'categories', 'created_at'},
+        )
+
+
+class PatientSearchEndpointTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_patients(range(1, 31), SName='Kamau')
+        make_patients(range(100, 105), SName='Otieno')
+
+    def search(self, **params):
+        response = self.client.get(reverse('patient-search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_fetch_one_extra_row_to_tell_if_there_is_more(self):
+        first = self.search(q='kam', limit=10)
+        self.assertEqual([patient['PatID'] for patient in first['patients']], list(range(1, 11)))
+        self.assertIn('offset=10', first['next'])
+
+        last = self.search(q='kam', limit=10, offset=20)
+        self.assertEqual([patient['PatID'] for patient in last['patients']], list(range(21, 31)))
+        self.assertIsNone(last['next'])
+        self.assertIn('offset=10', last['previous'])
+
+    def test_limit_is_capped(self):
+        make_patients(range(200, 350), SName='Kamau')
+        self.assertEqual(len(self.search(q='kam', limit=1000)['patients']), 100)
+
+    def test_short_query_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('patient-search'), {'q': 'k'}).status_code, 400)
+
+
+class CompressionMiddlewareTests(TestCase):
+    body = b'{"patients": []}' * 200
+
+    def compress(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/', headers={'Accept-Encoding': accept_encoding})
+        return CompressionMiddleware(lambda request: response).process_response(request, response)
+
+    def json_response(self, body=None, **headers):
+        return HttpResponse(self.body if body is None else body, content_type='application/json', headers=headers)
+
+    def test_gzip(self):
+        response = self.compress(self.json_response())
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(zlib.decompress(response.content, 31), self.body)
+
+    @skipUnless(brotli and zstandard, 'brotli and zstandard are not installed')
+    def test_negotiation(self):
+        for accept_encoding, expected in (
+            ('gzip, deflate, br, zstd', 'br'),
+            ('gzip, zstd', 'zstd'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('*', 'br'),
+            ('br;q=0, *;q=0.1', 'zstd'),
+        ):
+            with self.subTest(accept_encoding):
+                response = self.compress(self.json_response(), accept_encoding)
+                self.assertEqual(response['Content-Encoding'], expected)
+
+        response = self.compress(self.json_response(), 'br')
+        self.assertEqual(brotli.decompress(response.content), self.body)
+        response = self.compress(self.json_response(), 'zstd')
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(response.content), self.body)
+
+    def test_unsupported_encoding_is_left_alone(self):
+        response = self.compress(self.json_response(), 'deflate, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @override_settings(COMPRESSION_MIN_SIZE=100)
+    def test_bodies_under_the_threshold_are_left_alone(self):
+        small = self.compress(self.json_response(b'x' * 99))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertFalse(small.has_header('Vary'))
+        self.assertEqual(self.compress(self.json_response(b'x' * 100))['Content-Encoding'], 'gzip')
+
+    def test_encoded_and_binary_responses_are_left_alone(self):
+        encoded = self.compress(self.json_response(**{'Content-Encoding': 'identity'}))
+        self.assertEqual(encoded['Content-Encoding'], 'identity')
+        self.assertEqual(encoded.content, self.body)
+        image = self.compress(HttpResponse(self.body, content_type='image/png'))
+        self.assertFalse(image.has_header('Content-Encoding'))
+
+    def test_strong_etag_is_weakened(self):
+        self.assertEqual(self.compress(self.json_response(ETag='"abc"'))['ETag'], 'W/"abc"')
+        self.assertEqual(self.compress(self.json_response(ETag='W/"abc"'))['ETag'], 'W/"abc"')
+
+    def test_streaming_response_is_compressed_on_the_fly(self):
+        lines = [b'{"PatID": %d}\n' % i for i in range(20000)]
+        response = self.compress(StreamingHttpResponse(iter(lines), content_type='application/x-ndjson'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+
+        chunks = list(response.streaming_content)
+        decompressor = zlib.decompressobj(31)
+        # Flushed every STREAM_FLUSH_SIZE bytes of input, not only at the end
+        before_last = b''.join(decompressor.decompress(chunk) for chunk in chunks[:-1])
+        self.assertGreaterEqual(len(before_last), len(b''.join(lines)) - STREAM_FLUSH_SIZE)
+        self.assertEqual(before_last + decompressor.decompress(chunks[-1]), b''.join(lines))
+
+
+@override_settings(QUERY_INSTRUMENTATION=True, QUERY_INSTRUMENTATION_SAMPLE_RATE=1.0, QUERY_N_PLUS_ONE_THRESHOLD=5)
+class QueryInstrumentationMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_patients(range(1, 11))
+
+    def timings(self, response):
+        return dict(timing.split(';', 1) for timing in response['Server-Timing'].split(', '))
+
+    @override_settings(QUERY_INSTRUMENTATION=False)
+    def test_disabled_middleware_is_not_used(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryInstrumentationMiddleware(lambda request: HttpResponse())
+        self.assertFalse(self.client.get(reverse('patient')).has_header('Server-Timing'))
+
+    def test_server_timing(self):
+        with self.assertLogs('Backendapi.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('patient'))
+        timings = self.timings(response)
+        self.assertEqual(list(timings), ['db', 'render', 'total'])
+        self.assertRegex(timings['db'], r'^dur=[0-9.]+;desc="[1-9][0-9]* queries"$')
+        self.assertRegex(timings['render'], r'^dur=[0-9.]+;')
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].path, reverse('patient'))
+        self.assertEqual(logs.records[0].status, 200)
+
+    def test_repeated_statements_are_reported(self):
+        def view(request):
+            for patid in range(1, 7):
+                Patient.objects.get(PatID=patid)
+            return HttpResponse()
+
+        middleware = QueryInstrumentationMiddleware(view)
+        with self.assertLogs('Backendapi.middleware', 'INFO') as logs:
+            response = middleware(RequestFactory().get('/n-plus-one/'))
+        self.assertEqual(self.timings(response)['n1'], 'desc="1 repeated statements"')
+        [warning] = [record for record in logs.records if record.levelname == 'WARNING']
+        self.assertEqual(warning.repeated, 6)
+        self.assertIn('WHERE', warning.sql)
+        # A plain HttpResponse isn't rendered afterwards
+        self.assertEqual(self.timings(response)['render'], 'dur=0.0;desc="response rendering"')
+
+    def test_statements_below_the_threshold_are_not_reported(self):
+        def view(request):
+            for patid in range(1, 5):
+                Patient.objects.get(PatID=patid)
+            return HttpResponse()
+
+        with self.assertLogs('Backendapi.middleware', 'INFO') as logs:
+            response = QueryInstrumentationMiddleware(view)(RequestFactory().get('/'))
+        self.assertNotIn('n1', self.timings(response))
+        self.assertEqual([record.levelname for record in logs.records], ['INFO'])
+
+
+class PatientProgramsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.diabetes = Category.objects.create(name='Diabetes')
+        cls.asthma = Category.objects.create(name='Asthma')
+        make_patients(range(1, 6))
+        make_patients(range(6, 9), city='Kisumu')
+        for patient in Patient.objects.filter(PatID__in=[1, 2]):
+            patient.categories.add(cls.asthma)
+
+    def setUp(self):
+        registry.reload()
+        user = User.objects.create_user('DR003', password='password')
+        self.headers = {'Authorization': f'Bearer {tokens_for_user(user).access_token}'}
+
+    def post(self, **data):
+        return self.client.post(reverse('patient-programs'), data, content_type='application/json',
+                                headers=self.headers)
+
+    def enrolled(self, category):
+        return sorted(category.patients.values_list('PatID', flat=True))
+
+    def test_add_and_remove_by_patid(self):
+        response = self.post(patient_ids=[1, 2, 3, 999], add=[self.diabetes.pk], remove=[self.asthma.pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'matched': 3, 'added': 3, 'removed': 2, 'not_found': 1})
+        self.assertEqual(self.enrolled(self.diabetes), [1, 2, 3])
+        self.assertEqual(self.enrolled(self.asthma), [])
+
+    def test_add_by_filter(self):
+        response = self.post(filter={'city': 'Kisumu'}, add=[self.diabetes.pk, self.asthma.pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'matched': 3, 'added': 6, 'removed': 0})
+        self.assertEqual(self.enrolled(self.asthma), [1, 2, 6, 7, 8])
+
+    def test_unknown_program_is_rejected(self):
+        response = self.post(patient_ids=[1], add=[self.diabetes.pk, 999999])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', response.json()['detail'])
+        self.assertEqual(self.enrolled(self.diabetes), [])
+
+    def test_bad_input_is_rejected(self):
+        for data in (
+            {'patient_ids': [1]},
+            {'patient_ids': [1], 'add': self.diabetes.pk},
+            {'patient_ids': [1], 'add': [True]},
+            {'patient_ids': [1], 'add': [str(self.diabetes.pk)]},
+            {'patient_ids': [True, 2], 'add': [self.diabetes.pk]},
+            {'patient_ids': ['1'], 'add': [self.diabetes.pk]},
+            {'patient_ids': [1], 'filter': {}, 'add': [self.diabetes.pk]},
+            {'add': [self.diabetes.pk]},
+            {'filter': [], 'add': [self.diabetes.pk]},
+            {'filter': {'category': 'x'}, 'add': [self.diabetes.pk]},
+            {'patient_ids': [1], 'add': [self.diabetes.pk], 'remove': [self.diabetes.pk]},
+        ):
+            with self.subTest(data):
+                self.assertEqual(self.post(**data).status_code, 400)
+        self.assertEqual(self.enrolled(self.diabetes), [])
+
+
+@override_settings(
+    CACHES={**settings.CACHES, 'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                             'LOCATION': 'login-throttle-tests'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user('DR004', password='password')
+
+    def login(self, employee_id='DR004', password='wrong', **headers):
+        return self.client.post(reverse('login'), {'employee_id': employee_id, 'password': password},
+                                content_type='application/json', **headers).status_code
+
+    def test_spoofed_forwarded_for_is_still_throttled(self):
+        rates = {'login_ip': '3/min', 'login_username': '100/min'}
+        with mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', rates):
+            statuses = [self.login(f'DR{i}', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}') for i in range(4)]
+            self.assertEqual(statuses, [401, 401, 401, 429])
+            # Other clients aren't affected
+            self.assertEqual(self.login(password='password', REMOTE_ADDR='10.1.1.1'), 200)
+
+    def test_attempts_per_username_are_limited_across_ips(self):
+        rates = {'login_ip': '100/min', 'login_username': '2/min'}
+        with mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', rates):
+            statuses = [self.login(REMOTE_ADDR=f'10.0.0.{i}') for i in range(3)]
+            self.assertEqual(statuses, [401, 401, 429])
+            self.assertEqual(self.login(password='password', REMOTE_ADDR='10.1.1.1'), 429)
+            self.assertEqual(self.login('DR005', REMOTE_ADDR='10.1.1.1'), 401)
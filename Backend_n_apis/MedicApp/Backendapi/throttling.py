@@ -0,0 +1,36 @@
+import hashlib
+
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from rest_framework.throttling import SimpleRateThrottle
+
+# Counters live in a cache every worker shares (CACHES['throttle']); with the
+# per-process default cache each worker would allow the full rate on its own
+throttle_cache = ConnectionProxy(caches, 'throttle')
+
+
+class LoginIPThrottle(SimpleRateThrottle):
+    """Login attempts per client IP, see DEFAULT_THROTTLE_RATES['login_ip']."""
+    scope = 'login_ip'
+    cache = throttle_cache
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginUsernameThrottle(SimpleRateThrottle):
+    """
+    Login attempts per employee_id, whichever IPs they come from, so
+    guessing one account's password can't be spread over many clients.
+    """
+    scope = 'login_username'
+    cache = throttle_cache
+
+    def get_cache_key(self, request, view):
+        data = request.data
+        username = data.get('employee_id') if hasattr(data, 'get') else None
+        if not username:
+            return None
+        # Hashed so arbitrary user input never ends up in a cache key
+        ident = hashlib.md5(str(username).encode(), usedforsecurity=False).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
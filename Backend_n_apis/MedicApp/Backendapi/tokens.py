@@ -0,0 +1,89 @@
+import os
+
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from Backend.models import Doctor
+from .revocation import blacklist_token, is_revoked
+
+SYSTEM_ADMIN = 'system_admin'
+DOCTOR = 'doctor'
+ROLE_CLAIMS = ('role', 'employee_id', 'doctor_id', 'is_active')
+
+
+def role_claims(user):
+    """
+    The claims permission classes authorize from. Doctors without a Doctor
+    row (e.g. users created through register_admin) get role None.
+    """
+    if user.username == os.environ.get('AdminCreds'):
+        return {'role': SYSTEM_ADMIN, 'employee_id': user.username, 'doctor_id': None, 'is_active': user.is_active}
+
+    try:
+        doctor = user.doctor
+    except Doctor.DoesNotExist:
+        return {'role': None, 'employee_id': user.username, 'doctor_id': None, 'is_active': user.is_active}
+    return {
+        'role': DOCTOR,
+        'employee_id': doctor.employee_id,
+        'doctor_id': doctor.pk,
+        'is_active': user.is_active and doctor.is_active,
+    }
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    Refresh token checked against the in-memory revocation registry rather
+    than with a blacklist query on every use.
+    """
+
+    def check_blacklist(self):
+        if is_revoked(self):
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        return blacklist_token(self)
+
+
+def tokens_for_user(user):
+    """RefreshToken.for_user() with the role claims, which the access token inherits."""
+    refresh = RevocableRefreshToken.for_user(user)
+    for claim, value in role_claims(user).items():
+        refresh[claim] = value
+    return refresh
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes re-read the user's role, so a doctor verified or deactivated
+    since login gets up to date claims on the next refresh.
+    """
+    token_class = RevocableRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        try:
+            user = User.objects.select_related('doctor').get(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]})
+        except (KeyError, User.DoesNotExist):
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        for claim, value in role_claims(user).items():
+            refresh[claim] = value
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data['refresh'] = str(refresh)
+
+        return data
@@ -5,6 +5,8 @@ from rest_framework_simplejwt.views import TokenRefreshView
 urlpatterns = [
     # Authentication URLs
     path('login/', views.user_login, name='login'),
+    path('logout/', views.user_logout, name='logout'),
+    path('logout/all/', views.user_logout_all, name='logout-all'),
     path('register/', views.register, name='register'),
     path('admin-register/', views.register_admin, name='admin-register'),
     path('register-doc/', views.registerdr, name='register-doc'),
@@ -13,11 +15,18 @@ urlpatterns = [
     
     # Patient URLs
     path('patient/', views.PatientRegistrationView.as_view(), name='patient'),
+    path('patient/search/', views.patient_search, name='patient-search'),
+    path('patient/import/', views.PatientImportView.as_view(), name='patient-import'),
+    path('patient/export/', views.patient_export, name='patient-export'),
+    path('patient/analytics/', views.patient_analytics, name='patient-analytics'),
+    path('patient/programs/', views.patient_programs, name='patient-programs'),
     path('patient/<str:patient_id>/', views.patient_detail, name='patient-detail'),
     path('patient/<str:patient_id>/credentials/', views.update_patient_credentials, name='update-patient-credentials'),
     
     # Doctor URLs
     path('doctors/', views.DoctorView.as_view(), name='doctors'),
+    path('doctors/onboard/', views.DoctorOnboardingView.as_view(), name='doctors-onboard'),
+    path('doctors/verify/', views.verify_doctors_batch, name='verify-doctors'),
     path('doctors/<str:user_id>/verify/', views.verify_user, name='verify-doctor'),  
     path('doctors/stats/', views.doctor_stats, name='doctor-stats'),
     
@@ -30,5 +39,6 @@ urlpatterns = [
     
     # Admin URLs
     path('admin-details/', views.admin_details, name='admin-details'),
+    path('cache-stats/', views.cache_stats, name='cache-stats'),
     
 ]
\ No newline at end of file
@@ -1,29 +1,56 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse,JsonResponse
+from django.http import HttpResponse,StreamingHttpResponse
 from django.contrib.auth import login, authenticate
 from django.shortcuts import render, redirect
-import json
+import orjson
 from django.shortcuts import render
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.views import APIView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated,AllowAny
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import MultiPartParser
+from .parsers import ORJSONParser
 from dotenv import load_dotenv
 import os
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
+from itertools import islice
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from django.core.mail import send_mail
 from Backend.models import Patient, Doctor, Category
-from Backend.serializers import PatientSerializer, DoctorSerializer, CategorySerializer
+from Backend.serializers import (
+    PatientSerializer, DoctorSerializer, CategorySerializer,
+    PatientValuesSerializer, DoctorValuesSerializer, CategoryValuesSerializer, parse_fields,
+)
+from Backend.cache import (
+    cache_stats as get_cache_stats, existing_category_ids, get_category_catalogue, get_doctor_stats,
+    unknown_category_ids,
+)
+from Backend.outbox import enqueue_mail
+from Backend.analytics import get_patient_analytics
+from Backend.enrollment import assign_categories, assign_categories_by_patid
+from Backend.onboarding import (
+    MAX_ROWS_PER_REQUEST, DoctorOnboarder, credentials_email, open_roster, verification_email, verify_doctors,
+)
+from Backend.importers import PatientImporter, RowError, format_from_name, open_rows
+from Backend.exporters import EXPORT_FORMATS, iter_patient_records
+from .pagination import PatientCursorPagination, PatientSearchPagination
+from .renderers import FastJsonResponse
+from .permissions import IsSystemAdmin
+from .throttling import LoginIPThrottle, LoginUsernameThrottle
+from .tokens import SYSTEM_ADMIN, RevocableRefreshToken, tokens_for_user
+from .revocation import blacklist_token, revoke_all
+from .conditional import conditional, patient_list_state, patient_detail_state, doctor_list_state
 from django.shortcuts import get_object_or_404
-from django.conf import settings
 import random
 import string
 
@@ -82,7 +109,7 @@ def register(request):
             first_name=first_name,
             last_name=last_name,
             email=email,
-            password=make_password('temp_unused_password'),  # Temporary password - will be replaced upon verification
+            password=make_password(None),  # Unusable until verification sets one, and costs no hashing
             is_active=False  # User cannot log in until verified by admin
         )
         
@@ -132,7 +159,7 @@ def registerdr(request):
             email=email,
             first_name=first_name,
             last_name=last_name,
-            password=make_password(password) if is_verified else make_password('temp_unused_password'),
+            password=make_password(password if is_verified else None),
             is_active=is_verified  # Only activate user if verified
         )
 
@@ -144,18 +171,9 @@ def registerdr(request):
             is_active=is_verified  # Only activate doctor if verified
         )
 
-        # Send login credentials via email only if this is a verified registration
+        # Queue login credentials via email only if this is a verified registration
         if is_verified:
-            try:
-                send_mail(
-                    'Your MedicApp Account Credentials',
-                    f'Hello {first_name},\n\nYour MedicApp account has been created. Here are your login credentials:\n\nEmployee ID: {employee_id}\nPassword: {password}\n\nPlease log in and change your password.',
-                    settings.EMAIL_HOST_USER,
-                    [email],
-                    fail_silently=False,
-                )
-            except Exception as e:
-                print(f"Error sending email: {str(e)}")
+            enqueue_mail(*credentials_email(first_name, employee_id, password), [email])
 
         return Response({
             "detail": "Doctor registered successfully!" if is_verified else "Doctor registered successfully! Waiting for verification."
@@ -166,6 +184,7 @@ def registerdr(request):
     
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginIPThrottle, LoginUsernameThrottle])
 def user_login(request):
     try:
         data = request.data
@@ -180,9 +199,9 @@ def user_login(request):
         user = authenticate(username=username, password=password)
         
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            refresh = tokens_for_user(user)
             access = refresh.access_token
-            if username == Admincreds:
+            if refresh['role'] == SYSTEM_ADMIN:
                 return Response({
                     'refresh': str(refresh),
                     'access': str(access),
@@ -206,29 +225,108 @@ def user_login(request):
     except Exception as e:
         return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def user_logout(request):
+    """
+    Revoke the access token used for this request and, when it is posted,
+    the refresh token it came with.
+    """
+    try:
+        refresh = request.data.get('refresh')
+        if refresh:
+            refresh = RevocableRefreshToken(refresh)
+            if refresh.get(api_settings.USER_ID_CLAIM) != request.user.pk:
+                return Response({"detail": "Token belongs to another user"}, status=status.HTTP_403_FORBIDDEN)
+            refresh.blacklist()
+        blacklist_token(request.auth)
+        return Response({"detail": "Logged out successfully"}, status=status.HTTP_200_OK)
+    except TokenError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def user_logout_all(request):
+    """Revoke every token issued to the caller, on all devices."""
+    try:
+        revoke_all(request.user)
+        return Response({"detail": "Logged out of all sessions"}, status=status.HTTP_200_OK)
+    except Exception as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@conditional(patient_detail_state)
 def patient_detail(request, patient_id):
     """
     Retrieve detailed information about a specific patient
     """
     try:
-        patient = Patient.objects.prefetch_related('categories').get(PatID=patient_id)
-        serializer = PatientSerializer(patient)
-        return Response(serializer.data)
-    except Patient.DoesNotExist:
-        return Response({"detail": "Patient not found"}, status=404)
+        normalized = request.query_params.get('normalize') == 'true'
+        serializer = PatientValuesSerializer(normalized=normalized)
+        patients = serializer.to_representation(serializer.values(Patient.objects.filter(PatID=patient_id)))
+        if not patients:
+            return Response({"detail": "Patient not found"}, status=404)
+
+        if normalized:
+            return Response({'patient': patients[0], 'categories': serializer.side_loaded_categories()})
+        return Response(patients[0])
+    except Exception as e:
+        return Response({"detail": str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def patient_search(request):
+    """
+    Ranked prefix search over patient names, city and PatID
+    """
+    query = request.query_params.get('q', '').strip()
+    if len(query) < 2 and not query.isdigit():
+        return Response({"detail": "Search term must be at least 2 characters"}, status=400)
+
+    try:
+        serializer = PatientValuesSerializer(parse_fields(request.query_params.get('fields')))
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=400)
+
+    try:
+        patients = serializer.values(Patient.objects.search(query))
+        paginator = PatientSearchPagination()
+        page = paginator.paginate_queryset(patients, request)
+        return paginator.get_paginated_response(serializer.to_representation(page))
     except Exception as e:
         return Response({"detail": str(e)}, status=500)
 
 class PatientRegistrationView(APIView):
     permission_classes = [AllowAny]
 
+    @method_decorator(conditional(patient_list_state))
     def get(self, request, *args, **kwargs):
         try:
-            patients = Patient.objects.all().prefetch_related('categories')
-            serializer = PatientSerializer(patients, many=True)
-            return Response({'patients': serializer.data}, status=200)
+            normalized = request.query_params.get('normalize') == 'true'
+            serializer = PatientValuesSerializer(parse_fields(request.query_params.get('fields')), normalized)
+            patients = serializer.values(Patient.objects.all())
+
+            # Legacy unpaginated shape, kept for clients that still need it
+            if request.query_params.get('all') == 'true':
+                response = Response({'patients': serializer.to_representation(patients)}, status=200)
+            else:
+                paginator = PatientCursorPagination()
+                page = paginator.paginate_queryset(patients, request, view=self)
+                response = paginator.get_paginated_response(serializer.to_representation(page))
+
+            # Normalized mode: patients carry category_ids, categories are sent once
+            if normalized:
+                response.data['categories'] = serializer.side_loaded_categories()
+            return response
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=400)
+        except NotFound as e:
+            return Response({'detail': str(e.detail)}, status=404)
         except Exception as e:
             return Response({'detail': str(e)}, status=500)
 
@@ -297,59 +395,188 @@ class PatientRegistrationView(APIView):
                 'detail': str(e)
             }, status=400)
 
+def filter_patients(patients, params):
+    """
+    Apply the optional q/city/category/created_after/created_before query
+    parameters to a patient queryset. Raises ValueError on malformed values.
+    """
+    if params.get('q'):
+        patients = patients.search(params['q'])
+    if params.get('city'):
+        patients = patients.filter(city=params['city'])
+    if params.get('category'):
+        if not params['category'].isdigit():
+            raise ValueError("category must be a number")
+        patients = patients.filter(categories__id=int(params['category']))
+
+    for param, lookup, days in (('created_after', 'created_at__gte', 0),
+                                ('created_before', 'created_at__lt', 1)):
+        if params.get(param):
+            day = parse_date(params[param])
+            if day is None:
+                raise ValueError(f"Invalid {param}. Use YYYY-MM-DD")
+            start = timezone.make_aware(datetime.combine(day + timedelta(days=days), time.min))
+            patients = patients.filter(**{lookup: start})
+    return patients
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def patient_export(request):
+    """
+    Stream patients with their program names as CSV or NDJSON (?output=).
+    Rows are read through a server-side cursor, so memory stays flat.
+    """
+    output = request.query_params.get('output', 'csv')
+    if output not in EXPORT_FORMATS:
+        return Response({"detail": "output must be csv or ndjson"}, status=400)
+
+    try:
+        patients = filter_patients(Patient.objects.all(), request.query_params)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=400)
+
+    lines, content_type, filename = EXPORT_FORMATS[output]
+    response = StreamingHttpResponse(lines(iter_patient_records(patients)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def patient_analytics(request):
+    """
+    Patient counts per program, city and age bracket, grouped in the database.
+    Accepts the same filters as the export.
+    """
+    try:
+        patients = filter_patients(Patient.objects.all(), request.query_params)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=400)
+
+    try:
+        return Response(get_patient_analytics(patients, request.query_params))
+    except Exception as e:
+        return Response({"detail": str(e)}, status=500)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def patient_programs(request):
+    """
+    Add and/or remove programs (`add`/`remove` category ids) for many
+    patients at once: the PatIDs in `patient_ids`, or every patient matching
+    `filter`, which takes the same filters as the export. Returns counts.
+    """
+    data = request.data
+    add, remove = data.get('add') or [], data.get('remove') or []
+    if not isinstance(add, list) or not isinstance(remove, list) or not (add or remove):
+        return Response({"detail": "add and/or remove must be lists of program ids"}, status=400)
+    # Not isinstance(): True and False are ints too
+    if not all(type(pk) is int for pk in add + remove):
+        return Response({"detail": "Program ids must be numbers"}, status=400)
+    unknown = sorted(unknown_category_ids(add + remove))
+    if unknown:
+        return Response({"detail": f"Unknown programs: {', '.join(map(str, unknown))}"}, status=400)
+    if set(add) & set(remove):
+        return Response({"detail": "A program can't be both added and removed"}, status=400)
+    if ('patient_ids' in data) == ('filter' in data):
+        return Response({"detail": "Send either patient_ids or filter"}, status=400)
+
+    try:
+        if 'patient_ids' in data:
+            patids = data['patient_ids']
+            if not isinstance(patids, list) or not all(type(patid) is int for patid in patids):
+                return Response({"detail": "patient_ids must be a list of numbers"}, status=400)
+            summary = assign_categories_by_patid(patids, add, remove)
+        else:
+            if not isinstance(data['filter'], dict):
+                return Response({"detail": "filter must be an object"}, status=400)
+            try:
+                params = {name: str(value) for name, value in data['filter'].items()}
+                patients = filter_patients(Patient.objects.all(), params)
+            except ValueError as e:
+                return Response({"detail": str(e)}, status=400)
+            summary = assign_categories(patients, add, remove)
+        return Response(summary, status=200)
+    except Exception as e:
+        return Response({"detail": str(e)}, status=500)
+
+class PatientImportView(APIView):
+    """
+    Bulk import patients from an uploaded CSV or NDJSON file. The file is
+    streamed in chunks; rows that fail validation are reported, not fatal.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "A CSV or NDJSON file is required"}, status=400)
+
+        file_format = request.data.get('format') or format_from_name(upload.name)
+        try:
+            rows = open_rows(upload, file_format)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        try:
+            summary = PatientImporter().run(rows)
+            return Response(summary, status=200)
+        except Exception as e:
+            return Response({"detail": str(e)}, status=500)
+
 @csrf_exempt
 @permission_classes([AllowAny])
 def update_patient_credentials(request, patient_id):
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
+            data = orjson.loads(request.body)
             patient = get_object_or_404(Patient, PatID=patient_id)
             
             
             if len(data) == 1 and 'category_ids' in data:
-                patient.categories.set(data['category_ids'])
-                return JsonResponse({'detail': 'Patient programs updated successfully'})
+                patient.categories.set(existing_category_ids(data['category_ids']))
+                return FastJsonResponse({'detail': 'Patient programs updated successfully'})
             
             # Otherwise, do a full update
             fields = ['FName', 'MName', 'SName', 'DOB', 'city']
             if not all(field in data for field in fields):
-                return JsonResponse({'detail': 'All fields are required for full update'}, status=400)
+                return FastJsonResponse({'detail': 'All fields are required for full update'}, status=400)
             
             try:
                 dob_date = datetime.strptime(data['DOB'], '%Y-%m-%d').date()
                 today = date.today()
                 new_age = today.year - dob_date.year - ((today.month, today.day) < (dob_date.month, dob_date.day))
             except ValueError:
-                return JsonResponse({'detail': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
+                return FastJsonResponse({'detail': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
             
             patient.FName = data['FName']
             patient.MName = data['MName']
             patient.SName = data['SName']
             patient.Age = new_age
             patient.city = data['city']
-            patient.categories.set(data.get('category_ids', []))
+            patient.categories.set(existing_category_ids(data.get('category_ids', [])))
             patient.save()
             
-            return JsonResponse({'detail': 'Patient data updated successfully'})
+            return FastJsonResponse({'detail': 'Patient data updated successfully'})
             
-        except json.JSONDecodeError:
-            return JsonResponse({'detail': 'Invalid JSON format'}, status=400)
+        except orjson.JSONDecodeError:
+            return FastJsonResponse({'detail': 'Invalid JSON format'}, status=400)
         except Exception as e:
-            return JsonResponse({'detail': str(e)}, status=500)
+            return FastJsonResponse({'detail': str(e)}, status=500)
 
-    return JsonResponse({'detail': 'Invalid request method'}, status=405)
+    return FastJsonResponse({'detail': 'Invalid request method'}, status=405)
 
 def send_email(request):
     if request.method == 'POST':
         try:
-            body = json.loads(request.body)
+            body = orjson.loads(request.body)
             employee_id = body.get('employee_id')
             email = body.get('email')
-        except json.JSONDecodeError:
-            return JsonResponse({'detail': 'Invalid JSON format'}, status=400)
+        except orjson.JSONDecodeError:
+            return FastJsonResponse({'detail': 'Invalid JSON format'}, status=400)
 
         if not employee_id or not email:
-            return JsonResponse({'detail': 'Employee ID and email are required'}, status=400)
+            return FastJsonResponse({'detail': 'Employee ID and email are required'}, status=400)
 
         try:
             user = get_object_or_404(User, username=employee_id)
@@ -361,18 +588,12 @@ def send_email(request):
             Please contact your administrator for assistance.
             """
 
-            send_mail(
-                'Password Reset Request',
-                email_content,
-                settings.EMAIL_HOST_USER,
-                [email],
-                fail_silently=False,
-            )
-            return JsonResponse({'detail': 'Email sent successfully!'}, status=200)
+            enqueue_mail('Password Reset Request', email_content, [email])
+            return FastJsonResponse({'detail': 'Email queued for delivery!'}, status=200)
         except Exception as e:
-            return JsonResponse({'detail': str(e)}, status=500)
+            return FastJsonResponse({'detail': str(e)}, status=500)
 
-    return JsonResponse({'detail': 'Invalid request method'}, status=405)
+    return FastJsonResponse({'detail': 'Invalid request method'}, status=405)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -412,22 +633,17 @@ def verify_admin(request):
 class DoctorView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(conditional(doctor_list_state))
     def get(self, request):
-        # Check if the current user is an admin
-        is_admin = request.user.username == os.environ.get('AdminCreds')
-        
-        # Retrieve all doctors with their related user info
-        doctors = Doctor.objects.select_related('user').all()
-        
-       
-        serializer = DoctorSerializer(doctors, many=True)
-        data = serializer.data
-        
-        # Add a field to indicate if the doctor needs verification
-        for doctor in data:
-            doctor['needs_verification'] = not doctor['is_active']
-            
-        return Response(data)
+        try:
+            serializer = DoctorValuesSerializer(parse_fields(request.query_params.get('fields')))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        # Retrieve all doctors with their related user info; the serializer
+        # also adds whether each doctor still needs verification
+        doctors = serializer.values(Doctor.objects.all())
+        return Response(serializer.to_representation(doctors))
     
     def post(self, request):
         try:
@@ -461,13 +677,58 @@ class DoctorView(APIView):
         except Doctor.DoesNotExist:
             return Response({"detail": "Doctor not found"}, status=404)
 
+class DoctorOnboardingView(APIView):
+    """
+    Onboard a roster of doctors: an uploaded CSV, NDJSON or JSON file, or a
+    JSON body {"doctors": [...]}. Accounts are verified and emailed their
+    credentials unless "verified" is false, up to DOCTOR_BATCH_MAX_ROWS of
+    them per request. Bad rows are reported per row.
+    """
+    permission_classes = [IsSystemAdmin]
+    parser_classes = [ORJSONParser, MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            file_format = request.data.get('format') or format_from_name(upload.name)
+            try:
+                rows = open_roster(upload, file_format)
+            except ValueError as e:
+                return Response({"detail": str(e)}, status=400)
+        else:
+            rows = request.data.get('doctors')
+            if not isinstance(rows, list):
+                return Response({"detail": "Upload a roster file or send a list of doctors"}, status=400)
+            rows = [row if isinstance(row, dict) else RowError('Expected a JSON object') for row in rows]
+
+        verified = request.data.get('verified', True) not in (False, 'false', 'False', '0')
+        if verified:
+            # Every verified account costs a password hash, so the roster is
+            # capped to what fits in one request
+            try:
+                rows = list(islice(rows, MAX_ROWS_PER_REQUEST + 1))
+            except ValueError as e:
+                return Response({"detail": str(e)}, status=400)
+            if len(rows) > MAX_ROWS_PER_REQUEST:
+                return Response({
+                    "detail": f"At most {MAX_ROWS_PER_REQUEST} verified doctors per request. "
+                              "Split the roster or use manage.py onboard_doctors"
+                }, status=400)
+        try:
+            summary = DoctorOnboarder(verified=verified).run(rows)
+            return Response(summary, status=200)
+        except Exception as e:
+            return Response({"detail": str(e)}, status=500)
+
 class CategoryView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data)
+        try:
+            serializer = CategoryValuesSerializer(parse_fields(request.query_params.get('fields')))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+        return Response(serializer.project(get_category_catalogue()))
     
     def post(self, request):
         serializer = CategorySerializer(data=request.data)
@@ -498,25 +759,20 @@ def category_detail(request, pk):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def doctor_stats(request):
-    total_doctors = Doctor.objects.count()
-    active_doctors = Doctor.objects.filter(is_active=True).count()
-    specializations = Doctor.objects.values('specialization').distinct().count()
-    
-    return Response({
-        'total_doctors': total_doctors,
-        'active_doctors': active_doctors,
-        'specializations': specializations
-    })
+    return Response(get_doctor_stats())
 
-@api_view(['GET', 'PUT'])
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def cache_stats(request):
+    """
+    Hit/miss counters of the in-process caches, for monitoring
+    """
+    return Response(get_cache_stats())
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsSystemAdmin])
 def admin_details(request):
     try:
-        # Check if the requesting user is admin
-        admin_id = os.environ.get('AdminCreds')
-        if request.user.username != admin_id:
-            return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
-        
         if request.method == 'PUT':
             email = request.data.get('email')
             if email:
@@ -531,17 +787,12 @@ def admin_details(request):
         return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsSystemAdmin])
 def verify_user(request, user_id):
     try:
         # Get the doctor's user account
         user = User.objects.get(username=user_id)
-        
-        # Check if the requesting user is admin
-        admin_id = os.environ.get('AdminCreds')
-        if request.user.username != admin_id:
-            return Response({"detail": "Not authorized"}, status=status.HTTP_403_FORBIDDEN)
-        
+
         # Generate a secure password
         temp_password = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
         
@@ -559,30 +810,45 @@ def verify_user(request, user_id):
             
             pass
         
-        # Send the credentials email
-        email_content = f"""
-        Welcome to MedicApp!
-        
-        Your account has been verified. You can now login with the following credentials:
-        Employee ID: {user.username}
-        Password: {temp_password}
-        
-        Please login using these credentials and change your password after first login.
-        """
-
-        send_mail(
-            'MedicApp Account Verified',
-            email_content,
-            settings.EMAIL_HOST_USER,
-            [user.email],
-            fail_silently=False,
-        )
+        # Queue the credentials email
+        enqueue_mail(*verification_email(user.username, temp_password), [user.email])
 
         return Response({
-            "detail": "Doctor verified successfully! Credentials have been sent."
+            "detail": "Doctor verified successfully! Credentials will be emailed shortly."
         })
         
     except User.DoesNotExist:
         return Response({"detail": "User not found"}, status=404)
     except Exception as e:
-        return Response({"detail": str(e)}, status=500)
\ No newline at end of file
+        return Response({"detail": str(e)}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([IsSystemAdmin])
+def verify_doctors_batch(request):
+    """
+    Verify many pending doctors at once: the `employee_ids` listed, or the
+    longest waiting ones with {"all_pending": true}, up to
+    DOCTOR_BATCH_MAX_ROWS per request. Returns a result per id, and with
+    all_pending how many are still waiting.
+    """
+    data = request.data
+    if data.get('all_pending') is True:
+        employee_ids = None
+    else:
+        employee_ids = data.get('employee_ids')
+        if not isinstance(employee_ids, list) or not employee_ids \
+                or not all(isinstance(employee_id, str) for employee_id in employee_ids):
+            return Response({"detail": "Send employee_ids or all_pending"}, status=400)
+        if len(set(employee_ids)) > MAX_ROWS_PER_REQUEST:
+            return Response({"detail": f"At most {MAX_ROWS_PER_REQUEST} doctors per request"}, status=400)
+
+    try:
+        results = verify_doctors(employee_ids, limit=MAX_ROWS_PER_REQUEST)
+    except Exception as e:
+        return Response({"detail": str(e)}, status=500)
+    counts = {outcome: list(results.values()).count(outcome) for outcome in set(results.values())}
+    response = {'counts': counts, 'results': results}
+    if employee_ids is None:
+        response['remaining'] = Doctor.objects.filter(is_active=False).count()
+    return Response(response)
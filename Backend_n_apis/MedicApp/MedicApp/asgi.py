@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MedicApp.settings')
+# Tells settings not to keep persistent per-thread database connections,
+# which async request handling would leak (see DB_POOL in settings)
+os.environ.setdefault('MEDICAPP_ASGI', '1')
 
 application = get_asgi_application()
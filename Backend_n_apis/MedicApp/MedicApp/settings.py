@@ -1,8 +1,10 @@
 from pathlib import Path
+import importlib.util
 import os
 from dotenv import load_dotenv
 import dj_database_url
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -25,6 +27,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'corsheaders',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
 ]
 
 REST_FRAMEWORK = {
@@ -32,13 +35,35 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'Backendapi.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'Backendapi.parsers.ORJSONParser',
+    ],
+    # Login attempts are throttled per client IP and per employee_id before
+    # any password is hashed (Backendapi.throttling), across all workers
+    # through CACHES['throttle']
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.environ.get('LOGIN_IP_RATE', '30/min'),
+        'login_username': os.environ.get('LOGIN_USERNAME_RATE', '10/min'),
+    },
+    # Reverse proxies in front of the app, whose X-Forwarded-For entries are
+    # trusted to name the client. With 0 the throttles key on REMOTE_ADDR and
+    # ignore the header, which any client could otherwise set to get a fresh
+    # login_ip bucket per request.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    'DEFAULT_RENDERER_CLASSES': [
+        'Backendapi.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
 
+# MessagePack is opt-in per request (Accept/Content-Type: application/msgpack)
+# and only offered when the msgpack package is installed
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('Backendapi.parsers.MessagePackParser')
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'Backendapi.renderers.MessagePackRenderer')
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=24),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=90),
@@ -63,11 +88,16 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 
     'JTI_CLAIM': 'jti',
+
+    # Re-reads role claims (Backendapi.tokens) on every refresh
+    'TOKEN_REFRESH_SERIALIZER': 'Backendapi.tokens.RoleTokenRefreshSerializer',
 }
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  
     'django.middleware.security.SecurityMiddleware',
+    'Backendapi.middleware.QueryInstrumentationMiddleware',
+    'Backendapi.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,6 +107,33 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
 
+# Per-request query count, db/render time and N+1 warnings
+# (Backendapi.middleware.QueryInstrumentationMiddleware), for a sample of
+# requests. Off by default; when off the middleware isn't loaded at all.
+QUERY_INSTRUMENTATION = os.environ.get('QUERY_INSTRUMENTATION', 'False') == 'True'
+QUERY_INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('QUERY_INSTRUMENTATION_SAMPLE_RATE', 0.1))
+QUERY_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_N_PLUS_ONE_THRESHOLD', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'Backendapi.middleware': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Response compression (Backendapi.middleware.CompressionMiddleware). gzip is
+# always available; br and zstd are offered when the brotli / zstandard
+# packages are installed.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_ENCODINGS = ('br', 'zstd', 'gzip')
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get('COMPRESSION_ZSTD_LEVEL', 3))
+
 ROOT_URLCONF = 'MedicApp.urls'
 
 TEMPLATES = [
@@ -110,7 +167,128 @@ DATABASES = {
 }
 
 
-DATABASES['default'] = dj_database_url.parse(os.getenv("DATABASECREDS"))
+# Database connections. Under WSGI every worker thread keeps its connection
+# open for DB_CONN_MAX_AGE seconds and health-checks it before reuse. Under
+# ASGI (MedicApp/asgi.py sets MEDICAPP_ASGI) sync code runs on changing
+# threads, so persistent connections would leak; use DB_POOL there instead.
+# DB_POOL needs psycopg 3 with psycopg-pool (pip install "psycopg[binary,pool]").
+# Set DB_PGBOUNCER when connecting through PgBouncer in transaction mode.
+ASGI_MODE = os.environ.get('MEDICAPP_ASGI') == '1'
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+DATABASES['default'] = dj_database_url.parse(
+    os.getenv("DATABASECREDS"),
+    conn_max_age=0 if DB_POOL or ASGI_MODE else DB_CONN_MAX_AGE,
+    conn_health_checks=True,
+    disable_server_side_cursors=os.environ.get('DB_PGBOUNCER', 'False') == 'True',
+)
+if DB_POOL:
+    if not importlib.util.find_spec('psycopg_pool'):
+        raise ImproperlyConfigured('DB_POOL needs psycopg 3 and psycopg-pool installed')
+    from psycopg_pool import ConnectionPool
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        # Connections are replaced after this many seconds, idle ones sooner
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'check': ConnectionPool.check_connection,
+    }
+
+
+# Cache: locmem by default, or a directory shared by all workers with
+# CACHE_BACKEND=file. locmem is per process, so with several workers a
+# category change reaches the others' catalogue only once CATEGORY_CACHE_TIMEOUT
+# expires; ids it doesn't know yet are checked against the database, so a new
+# category can be assigned straight away.
+if os.environ.get('CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'medicapp',
+        }
+    }
+
+# Login throttle counters (Backendapi.throttling) must be seen by every worker,
+# or N workers would allow N times LOGIN_IP_RATE / LOGIN_USERNAME_RATE; so
+# must the token revocation version (Backendapi.revocation). They always go
+# to a directory shared by the processes on this host; point
+# THROTTLE_CACHE_LOCATION at shared storage when running several hosts.
+CACHES['throttle'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'throttle')),
+    'OPTIONS': {'MAX_ENTRIES': 10000},
+}
+
+CATEGORY_CACHE_TIMEOUT = int(os.environ.get('CATEGORY_CACHE_TIMEOUT', 300))
+DOCTOR_STATS_CACHE_TIMEOUT = int(os.environ.get('DOCTOR_STATS_CACHE_TIMEOUT', 60))
+ANALYTICS_CACHE_TIMEOUT = int(os.environ.get('ANALYTICS_CACHE_TIMEOUT', 300))
+# How long CachedJWTAuthentication may reuse a user before reloading it. Its
+# is_active and password are re-read every AUTH_USER_RECHECK_INTERVAL seconds,
+# which bounds how late a deactivation made through another worker applies.
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 60))
+AUTH_USER_RECHECK_INTERVAL = float(os.environ.get('AUTH_USER_RECHECK_INTERVAL', 5))
+
+# Admin changelists for large tables (Backend.admin.PerformanceModeAdmin).
+# Past ADMIN_ESTIMATED_COUNT_THRESHOLD rows, as Postgres' planner estimates
+# them, pages show that estimate instead of running COUNT(*); city and
+# specialization filter choices are cached for ADMIN_FILTER_CACHE_TIMEOUT.
+ADMIN_PERFORMANCE_MODE = os.environ.get('ADMIN_PERFORMANCE_MODE', 'True') == 'True'
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000))
+ADMIN_FILTER_CACHE_TIMEOUT = int(os.environ.get('ADMIN_FILTER_CACHE_TIMEOUT', 300))
+
+# Token revocation (Backendapi.revocation): each process keeps a bloom filter
+# of blacklisted jtis in front of the blacklist table and re-syncs it every
+# REVOCATION_SYNC_INTERVAL seconds, or right away when CACHES['throttle'] says
+# another process revoked something. The filter is rebuilt on a background
+# thread every REVOCATION_REBUILD_INTERVAL seconds; until the first build is
+# done, tokens are checked against the table.
+REVOCATION_SYNC_INTERVAL = float(os.environ.get('REVOCATION_SYNC_INTERVAL', 5))
+REVOCATION_REBUILD_INTERVAL = float(os.environ.get('REVOCATION_REBUILD_INTERVAL', 3600))
+REVOCATION_BLOOM_CAPACITY = int(os.environ.get('REVOCATION_BLOOM_CAPACITY', 1_000_000))
+REVOCATION_BLOOM_ERROR_RATE = float(os.environ.get('REVOCATION_BLOOM_ERROR_RATE', 0.001))
+
+
+# Password hashing. PASSWORD_HASHER picks the hasher for new passwords; the
+# others stay listed so existing hashes still verify and are re-hashed with
+# the preferred one (or new cost settings) on the owner's next login.
+# argon2 and bcrypt need the argon2-cffi / bcrypt packages.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 870000))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+# Processes hashing generated passwords for bulk onboarding (Backend.hashers.make_passwords).
+# Each web worker starts its pool on first use and shuts it down after
+# PASSWORD_HASH_POOL_IDLE_TIMEOUT seconds without work.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_POOL_IDLE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_POOL_IDLE_TIMEOUT', 60))
+# Most doctors a single request to doctors/onboard/ (verified accounts) or
+# doctors/verify/ may hash a password for. Each hash costs about 0.4s of a core
+# at the default PBKDF2 iterations, so keep this well inside the worker
+# timeout; larger rosters go through `manage.py onboard_doctors`.
+DOCTOR_BATCH_MAX_ROWS = int(os.environ.get('DOCTOR_BATCH_MAX_ROWS', 50))
+
+_password_hashers = {
+    'pbkdf2': 'Backend.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'Backend.hashers.TunedScryptPasswordHasher',
+}
+if importlib.util.find_spec('argon2'):
+    _password_hashers['argon2'] = 'django.contrib.auth.hashers.Argon2PasswordHasher'
+if importlib.util.find_spec('bcrypt'):
+    _password_hashers['bcrypt'] = 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher'
+if PASSWORD_HASHER not in _password_hashers:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER must be one of {', '.join(_password_hashers)}, not '{PASSWORD_HASHER}'"
+    )
+PASSWORD_HASHERS = [_password_hashers.pop(PASSWORD_HASHER), *_password_hashers.values()]
 
 
 # Password validation
@@ -178,9 +356,19 @@ CORS_ALLOW_CREDENTIALS = True
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_HOST = 'smtp.gmail.com'
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+# EMAIL_BACKEND can be switched to django.core.mail.backends.console.EmailBackend
+# (or locmem) for local work, or pointed at a debugging SMTP server via EMAIL_HOST/EMAIL_PORT
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER') 
-EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
\ No newline at end of file
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+# Outgoing mail is queued in the EmailOutbox table. With the background thread
+# on, each worker delivers right after the request commits; turn it off when
+# running `manage.py send_outbox --loop` as a separate process instead.
+EMAIL_OUTBOX_BACKGROUND_THREAD = os.environ.get('EMAIL_OUTBOX_BACKGROUND_THREAD', 'True') == 'True'
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+# Seconds a sender may hold a claimed batch; if it dies, the batch is retried after this
+EMAIL_OUTBOX_LEASE = 600
@@ -24,7 +24,7 @@ const AdminOverview = () => {
     const fetchData = async () => {
       try {
         const [patientsResponse, doctorsStatsResponse, categoriesResponse, adminResponse] = await Promise.all([
-          axiosInstance.get('/backendapi/patient/'),
+          axiosInstance.get('/backendapi/patient/?all=true'),
           axiosInstance.get('/backendapi/doctors/stats/'),
           axiosInstance.get('/backendapi/categories/'),
           axiosInstance.get('/backendapi/admin-details/')
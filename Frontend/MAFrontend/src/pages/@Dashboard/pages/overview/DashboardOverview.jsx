@@ -13,7 +13,7 @@ const DashboardOverview = () => {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const patientsResponse = await axiosInstance.get('/backendapi/patient/');
+        const patientsResponse = await axiosInstance.get('/backendapi/patient/?all=true');
         const patients = patientsResponse.data.patients;
 
         // Update category count calculation to use the categories array
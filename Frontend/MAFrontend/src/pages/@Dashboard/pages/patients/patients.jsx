@@ -38,7 +38,7 @@ const Patients = () => {
 
   const fetchPatients = async () => {
     try {
-      const response = await axiosInstance.get('/backendapi/patient/');
+      const response = await axiosInstance.get('/backendapi/patient/?all=true');
       setPatients(response.data.patients);
       setLoading(false);
     } catch (err) {